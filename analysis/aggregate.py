@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+import sqlite3
+import os
+
+import utils
+
+pd = utils.lazyImport('pandas')
+
+# One row per capture plus its symbol distribution and a decimated H curve, what merge.py needs without opening any experiment
+VERSION = 2 # Bump when SCHEMA changes, the tables are dropped and every capture is added again
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS captures (fbase TEXT PRIMARY KEY, user TEXT, name TEXT, key TEXT, frames INTEGER, H REAL, converged INTEGER);
+CREATE TABLE IF NOT EXISTS symbols (fbase TEXT, symbol TEXT, code INTEGER, count INTEGER, p REAL, information REAL);
+CREATE TABLE IF NOT EXISTS curve (fbase TEXT, x INTEGER, H REAL);
+CREATE INDEX IF NOT EXISTS symbols_fbase ON symbols (fbase);
+CREATE INDEX IF NOT EXISTS curve_fbase ON curve (fbase);
+'''
+
+def connect():
+  os.makedirs(utils.OUTDIR, exist_ok = True)
+  con = sqlite3.connect(utils.aggregatePath(), timeout = 60) # analyzeAll's workers write at the same time
+  if con.execute('PRAGMA user_version').fetchone()[0] != VERSION:
+    con.executescript('DROP TABLE IF EXISTS captures; DROP TABLE IF EXISTS symbols; DROP TABLE IF EXISTS curve;')
+    con.execute(f'PRAGMA user_version = {VERSION}')
+  con.executescript(SCHEMA)
+  return con
+
+def key(fbase):
+  # Key of the foo stage the capture's summary was built from, None if it isn't there
+  with connect() as con:
+    row = con.execute('SELECT key FROM captures WHERE fbase = ?', (fbase,)).fetchone()
+  return row[0] if row else None
+
+def update(fbase, user, name, key, symbolsDf, curve, frames, converged = None):
+  # curve is the decimated H (x, y), its last point is the H of the whole capture
+  x, y = curve
+  with connect() as con:
+    for table in ['captures', 'symbols', 'curve']:
+      con.execute(f'DELETE FROM {table} WHERE fbase = ?', (fbase,))
+    con.execute('INSERT INTO captures VALUES (?, ?, ?, ?, ?, ?, ?)', (fbase, user, name, key, frames, float(y[-1]) if len(y) else None, converged))
+    df = symbolsDf[['symbol', 'code', 'count', 'p', 'information']].astype({ 'symbol': str, 'code': int, 'count': int })
+    con.executemany('INSERT INTO symbols VALUES (?, ?, ?, ?, ?, ?)', [(fbase, *row) for row in df.itertuples(index = False, name = None)])
+    con.executemany('INSERT INTO curve VALUES (?, ?, ?)', [(fbase, int(i), float(h)) for i, h in zip(x, y)])
+
+def captures():
+  with connect() as con:
+    # xmax is how much of the H curve to plot, up to where it converged
+    return pd.read_sql('SELECT *, COALESCE(converged, frames) AS xmax FROM captures ORDER BY fbase', con)
+
+def symbols(fbase):
+  with connect() as con:
+    return pd.read_sql('SELECT symbol, code, count, p, information FROM symbols WHERE fbase = ? ORDER BY rowid', con, params = (fbase,))
+
+def curve(fbase):
+  with connect() as con:
+    return pd.read_sql('SELECT x, H FROM curve WHERE fbase = ? ORDER BY x', con, params = (fbase,))
@@ -1,21 +1,71 @@
 #!/usr/bin/env python3
 from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from time import time
+import traceback
 import os
 
 from experiment import Experiment
+import instrument
+import render
 import utils
 
-def analyze(user, name, load):
-  return Experiment(user, name).process(load = load).report()
+def analyze(user, name, load, chunked = False, **options):
+  # options go to Experiment: symbols, frames, seconds, untilConverged
+  return Experiment(user, name, **options).process(load = load, chunked = chunked).report(load = load)
 
-def analyzeAll(load):
-  exps = []
-  for fpath in os.listdir(utils.INDIR):
+def analyzeSummary(user, name, load, renderArgs = None, chunked = False, **options):
+  # What analyzeAll returns per capture, small enough to send back from a worker
+  summary = { 'user': user, 'name': name, 'fbase': utils.experimentName(user, name), 'error': None }
+  start = time()
+  try:
+    if renderArgs is not None:
+      render.configure(**renderArgs)
+    analyze(user, name, load, chunked, **options)
+  except Exception:
+    summary['error'] = traceback.format_exc()
+  finally:
+    render.close()
+  summary['time'] = time() - start
+  return summary
+
+def listExperiments():
+  if not os.path.isdir(utils.INDIR):
+    return
+  for fpath in sorted(os.listdir(utils.INDIR)):
+    if not fpath.endswith('.pcap'): # Skips the index sidecars
+      continue
     user, rest = fpath.split('_', maxsplit = 1)
     name, _ = rest.split('.', maxsplit = 1)
-    exps.append(analyze(user, name, load))
+    yield user, name
+
+def analyzeAll(load, jobs = 1, renderArgs = None, chunked = False, **options):
+  experiments = list(listExperiments())
+  summaries = {}
+
+  def done(summary):
+    summaries[summary['fbase']] = summary
+    status = 'ok' if summary['error'] is None else f'FAILED\n{summary["error"]}'
+    print(f'[analyzeAll] {len(summaries)}/{len(experiments)} {summary["fbase"]} {status} ({summary["time"]:.1f}s)')
+
+  if jobs == 1:
+    for user, name in experiments:
+      done(analyzeSummary(user, name, load, chunked = chunked, **options))
+  else:
+    renderArgs = { **(renderArgs or {}), 'jobs': 1 } # Each capture already has its own process, no pool inside a pool
+    with ProcessPoolExecutor(jobs) as pool:
+      futures = [pool.submit(analyzeSummary, user, name, load, renderArgs, chunked, **options) for user, name in experiments]
+      for future in as_completed(futures):
+        done(future.result())
+
+  return [summaries[utils.experimentName(user, name)] for user, name in experiments]
 
-  return exps
+def parseRange(s, cast):
+  # 'START:STOP' -> (start, stop), an empty side is None and 'STOP' alone is a prefix
+  if s is None:
+    return None
+  start, _, stop = s.rpartition(':')
+  return (cast(start) if start else None, cast(stop) if stop else None)
 
 if __name__ == '__main__':
   parser = ArgumentParser(
@@ -24,11 +74,29 @@ if __name__ == '__main__':
   )
   parser.add_argument('experiment', nargs = 2, help = '{USER} {EXPERIMENT_NAME}')
   parser.add_argument('--all', default = False, help = 'Run for all .pcap files (ignores user and experiment)')
-  parser.add_argument('-f', '--force', default = False, help = 'Replace previously saved csv')
+  parser.add_argument('-j', '--jobs', type = int, default = 1, help = 'Captures to analyze in parallel with --all')
+  parser.add_argument('--formats', default = ','.join(render.FORMATS), help = 'Comma separated figure formats to write')
+  parser.add_argument('--render-jobs', type = int, default = render.JOBS, help = 'Processes exporting figures')
+  parser.add_argument('--chunked', action = 'store_true', help = 'Process the capture in blocks so it never has to fit in memory')
+  parser.add_argument('--symbols', default = None, help = 'Comma separated fields a symbol is made of (dire, cast, ethertype, inner, vlan, ipproto, ports), dire,ethertype by default')
+  parser.add_argument('--frames', default = None, help = 'START:STOP, only analyze these frames (like a slice, either can be left out)')
+  parser.add_argument('--seconds', default = None, help = 'START:STOP, only analyze the frames in this range of seconds since the first one')
+  parser.add_argument('--until-converged', action = 'store_true', help = 'Stop reading the capture once its entropy converged')
+  parser.add_argument('--stage-peaks', action = 'store_true', help = 'Reset the peak RSS at every stage so each one reports its own (Linux only)')
+  parser.add_argument('-f', '--force', default = False, help = 'Recompute every stage even if its cache is up to date')
   args = parser.parse_args()
   args.all = bool(args.all)
   args.force = bool(args.force)
+  instrument.RESET_PEAK = args.stage_peaks
+  renderArgs = { 'formats': args.formats.split(','), 'jobs': args.render_jobs }
+  render.configure(**renderArgs)
+  options = {
+    'symbols': args.symbols.split(',') if args.symbols else None,
+    'frames': parseRange(args.frames, int),
+    'seconds': parseRange(args.seconds, float),
+    'untilConverged': args.until_converged,
+  }
 
   if args.all:
-    analyzeAll(not args.force)
-  else: analyze(*args.experiment, not args.force)
+    analyzeAll(not args.force, args.jobs, renderArgs, args.chunked, **options)
+  else: analyze(*args.experiment, not args.force, args.chunked, **options)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+import pandas as pd
+import numpy as np
+
+class ArpStats:
+  # Everything reportOpt needs, updated one chunk of optDf at a time. Memory grows with hosts and edges, not with frames
+  def __init__(self):
+    self.n = 0
+    self.hosts = None # ip -> frames it's the sender or the target of
+    self.src = None # (psrc, op) -> frames
+    self.dst = None # (pdst, op) -> frames
+    self.edges = None # (psrc, pdst) -> whois frames, who asks for whom
+    self.macs = None # (psrc, hwsrc) -> frames, the MACs each IP sent from
+
+  def update(self, df):
+    self.n += len(df)
+    self.hosts = _add(self.hosts, pd.concat([df['psrc'], df['pdst']]).value_counts())
+    self.src = _add(self.src, df.groupby(['psrc', 'op']).size())
+    self.dst = _add(self.dst, df.groupby(['pdst', 'op']).size())
+    self.edges = _add(self.edges, df[df['op'] == 'whois'].groupby(['psrc', 'pdst']).size())
+    self.macs = _add(self.macs, df[df['psrc'] != '0.0.0.0'].groupby(['psrc', 'hwsrc']).size()) # Probes don't have an IP yet
+    return self
+
+  def hostsDf(self):
+    df = _probabilities(self.hosts, self.hosts.sum())
+    return df.sort_values('information', ascending = True)
+
+  @property
+  def H(self):
+    df = self.hostsDf()
+    return (df['p'] * df['information']).sum()
+
+  def router(self):
+    # The host most other hosts ask for, ties go to the one in the most frames
+    askers = self.edges.index.get_level_values('pdst').value_counts() if self.edges is not None and len(self.edges) else pd.Series(dtype = np.int64)
+    df = pd.DataFrame({ 'askers': askers.reindex(self.hosts.index, fill_value = 0), 'count': self.hosts })
+    return df.sort_values(['askers', 'count'], ascending = False).index[0]
+
+  def symbolsDf(self, v):
+    # v is 'src' or 'dst', symbols are (ip, op) over every ARP frame
+    counts = getattr(self, v)
+    counts = pd.Series(counts.to_numpy(), index = [f'({ip}, {op})' for ip, op in counts.index])
+    return _probabilities(counts, self.n)
+
+  def macsDf(self):
+    # IP -> the MAC it used the most and how many it used
+    df = self.macs.rename('count').reset_index().sort_values('count', ascending = False)
+    macs = df.groupby('psrc', sort = False).agg(mac = ('hwsrc', 'first'), macs = ('hwsrc', 'size'))
+    return macs.reset_index().rename(columns = { 'psrc': 'ip' })
+
+def _add(total, counts):
+  return counts.astype(np.int64) if total is None else total.add(counts, fill_value = 0).astype(np.int64)
+
+def _probabilities(counts, total):
+  df = pd.DataFrame({ 'symbol': counts.index, 'count': counts.to_numpy() })
+  df['p'] = df['count'] / total
+  df['information'] = -np.log2(df['p'])
+  return df
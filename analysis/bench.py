@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from datetime import datetime
+from time import perf_counter, process_time
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+import extract
+import pcapio
+import render
+import utils
+
+SIZES = [10000, 100000, 1000000]
+MIX = { # (dire, ethertype) -> weight, about what JB_boot has
+  ('UNICAST', 0x0800): 80,
+  ('UNICAST', 0x86DD): 12,
+  ('UNICAST', 0x0806): 4,
+  ('BROADCAST', 0x0806): 2,
+  ('BROADCAST', 0x0800): 2,
+}
+FRAME_LEN = 60 # Minimum Ethernet frame without FCS, ARP gets padded to it too
+STARTUP = { # Command -> seconds it should take from a fresh interpreter, median of a few runs
+  'analyze --help': (['analyze.py', '--help'], 0.5),
+  'sniff --help': (['sniff.py', '--help'], 0.5),
+  'merge --help': (['merge.py', '--help'], 0.5),
+  'analyze cached': (['analyze.py', 'bench', 'startup', '--formats', 'html', '--render-jobs', '1'], 1.0), # Every stage and the report fresh
+}
+
+#************************************************************
+#* Synthetic captures ***************************************
+
+def synthPcap(fpath, packets, *, mix = None, hosts = 32, rate = 1000, seed = 0, blockPackets = 100000):
+  # Ethernet frames with the symbols of mix and well formed ARP between hosts, the first host is asked for the most (the router)
+  rng = np.random.default_rng(seed)
+  mix = mix or MIX
+  symbols = list(mix)
+  weights = np.array([mix[symbol] for symbol in symbols], dtype = np.float64)
+  hostWeights = 1 / np.arange(1, hosts + 1)
+
+  macs = np.zeros((hosts, 6), dtype = np.uint8)
+  macs[:, 0] = 0x02 # Locally administered
+  macs[:, 4], macs[:, 5] = np.arange(hosts) >> 8, np.arange(hosts) & 0xFF
+  ips = np.zeros((hosts, 4), dtype = np.uint8)
+  ips[:, :2] = [192, 168]
+  ips[:, 2], ips[:, 3] = (np.arange(hosts) + 1) >> 8, (np.arange(hosts) + 1) & 0xFF
+
+  t = datetime(2024, 1, 1).timestamp()
+  with pcapio.PcapWriter(fpath) as writer:
+    for start in range(0, packets, blockPackets):
+      n = min(blockPackets, packets - start)
+      which = rng.choice(len(symbols), n, p = weights / weights.sum())
+      broadcast = np.array([symbols[i][0] == 'BROADCAST' for i in which])
+      types = np.array([symbols[i][1] for i in which], dtype = np.uint16)
+      src = rng.integers(hosts, size = n)
+      dst = rng.choice(hosts, n, p = hostWeights / hostWeights.sum())
+
+      frames = np.zeros((n, FRAME_LEN), dtype = np.uint8)
+      frames[:, 0:6] = np.where(broadcast[:, None], 0xFF, macs[dst])
+      frames[:, 6:12] = macs[src]
+      frames[:, 12], frames[:, 13] = types >> 8, types & 0xFF
+
+      arp = types == 0x0806
+      reply = arp & ~broadcast & (rng.random(n) < 0.5)
+      body = frames[arp]
+      body[:, 14:22] = [0, 1, 8, 0, 6, 4, 0, 1] # Ethernet/IPv4, whois
+      body[reply[arp], 21] = 2
+      body[:, 22:28] = macs[src[arp]]
+      body[:, 28:32] = ips[src[arp]]
+      body[:, 32:38] = np.where(reply[arp][:, None], macs[dst[arp]], 0)
+      body[:, 38:42] = ips[dst[arp]]
+      frames[arp] = body
+
+      times = t + np.cumsum(rng.exponential(1 / rate, n))
+      t = times[-1]
+      writer.writeMany(times, frames)
+  return fpath
+
+def parseMix(s):
+  # "UNICAST:IPv4=80,BROADCAST:ARP=2", ethertypes by name or number
+  types = { name: t for t, name in utils.type2Str.items() }
+  mix = {}
+  for part in s.split(','):
+    symbol, weight = part.split('=')
+    dire, proto = symbol.split(':')
+    mix[(dire.upper(), types[proto] if proto in types else int(proto, 0))] = float(weight)
+  return mix
+
+#************************************************************
+#* Measure **************************************************
+
+def benchSize(packets, *, mix = None, formats = None, chunked = False, memory = False, keep = False):
+  # Runs in its own process, so maxrss belongs to this size only
+  from experiment import Experiment
+  from service import Service
+  tmpdir = tempfile.mkdtemp(prefix = 'bench_')
+  utils.INDIR, utils.OUTDIR = os.path.join(tmpdir, 'data'), os.path.join(tmpdir, 'out')
+  os.makedirs(utils.INDIR); os.makedirs(utils.OUTDIR)
+  render.configure(formats = formats or ['html'], jobs = 1)
+  if memory:
+    tracemalloc.start()
+
+  records = []
+  def measure(stage, fn, rows = None):
+    if memory:
+      tracemalloc.reset_peak()
+    wall, cpu = perf_counter(), process_time()
+    with redirect_stdout(io.StringIO()):
+      fn()
+    records.append({
+      'packets': packets, 'stage': stage,
+      'wall': perf_counter() - wall, 'cpu': process_time() - cpu,
+      'peak': tracemalloc.get_traced_memory()[1] / 2**20 if memory else None, # MB allocated through Python, NumPy included
+      'maxrss': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10, # MB, high water mark of the whole process
+      'rows': rows() if rows else None,
+    })
+
+  user, name = 'bench', str(packets)
+  fbase = utils.experimentName(user, name)
+  measure('synth', lambda: synthPcap(utils.pcapPath(fbase), packets, mix = mix), lambda: packets)
+  experiment = Experiment(user, name)
+  if chunked:
+    measure('chunked', lambda: experiment.processChunked(load = False))
+  else:
+    measure('scan', lambda: experiment.scans.update(extract.scan(utils.pcapPath(fbase), list(extract.EXTRACTORS))))
+    for stage, info in Experiment.STAGES.items():
+      measure(stage, lambda: getattr(experiment, info['get'])(True, load = False), lambda: len(getattr(experiment, info['df'])))
+  measure('warm', lambda: Experiment(user, name).process())
+  measure('report', experiment.report)
+  service = Service() # Same query from disk and then from the loaded experiment
+  for stage in ['query cold', 'query warm']:
+    measure(stage, lambda: service.curve(user, name, points = 2000))
+
+  if memory:
+    tracemalloc.stop()
+  if not keep:
+    shutil.rmtree(tmpdir)
+  return records
+
+def startup(*, runs = 5, keep = False):
+  # Each command runs in a fresh interpreter inside a scratch data/out, after one analyze.py run fills the cache
+  here = os.path.dirname(os.path.abspath(__file__))
+  tmpdir = tempfile.mkdtemp(prefix = 'bench_')
+  os.makedirs(os.path.join(tmpdir, 'data'))
+  synthPcap(os.path.join(tmpdir, 'data', 'bench_startup.pcap'), 10000)
+  run = lambda args: subprocess.run([sys.executable, os.path.join(here, args[0]), *args[1:]], cwd = tmpdir, capture_output = True, check = True)
+  run(STARTUP['analyze cached'][0])
+
+  records = []
+  for command, (args, budget) in STARTUP.items():
+    walls = []
+    for _ in range(runs):
+      wall = perf_counter()
+      run(args)
+      walls.append(perf_counter() - wall)
+    records.append({ 'packets': None, 'stage': f'startup {command}', 'wall': float(np.median(walls)), 'budget': budget })
+    print(f'[startup] {command}: {records[-1]["wall"]:.3f}s (budget {budget}s){"" if records[-1]["wall"] <= budget else " OVER BUDGET"}')
+
+  if not keep:
+    shutil.rmtree(tmpdir)
+  return records
+
+def revision():
+  try:
+    return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output = True, text = True, check = True, cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def bench(sizes, *, out = None, **kwargs):
+  records = []
+  for packets in sizes:
+    print(f'[bench] {packets} packets')
+    with ProcessPoolExecutor(1) as pool: # Fresh process per size
+      sizeRecords = pool.submit(benchSize, packets, **kwargs).result()
+    records += save(sizeRecords, out, chunked = kwargs.get('chunked', False))
+  return records
+
+def save(records, out, **meta):
+  meta = { 'rev': revision(), 'date': datetime.now().isoformat(timespec = 'seconds'), **meta }
+  records = [{ **meta, **record } for record in records]
+  if out is not None:
+    with open(out, 'a') as fout:
+      for record in records:
+        fout.write(json.dumps(record) + '\n')
+  return records
+
+def summary(records, baseline = None):
+  # Wall time per stage and size, with the ratio to the baseline revision's records when given
+  df = pd.DataFrame(records)
+  table = df.pivot_table(index = 'stage', columns = 'packets', values = 'wall', sort = False)
+  if baseline is not None:
+    base = baseline.pivot_table(index = 'stage', columns = 'packets', values = 'wall', sort = False)
+    table = table.join(table / base.reindex_like(table), rsuffix = ' ratio')
+  return table
+
+if __name__ == '__main__':
+  parser = ArgumentParser(
+    prog = 'bench',
+    description = 'Time and memory of each analysis stage over synthetic captures',
+  )
+  parser.add_argument('--sizes', default = ','.join(map(str, SIZES)), help = 'Comma separated packet counts')
+  parser.add_argument('--mix', default = None, help = 'Symbol weights, e.g. "UNICAST:IPv4=80,BROADCAST:ARP=2"')
+  parser.add_argument('--formats', default = 'html', help = 'Comma separated figure formats for the report step')
+  parser.add_argument('--chunked', action = 'store_true', help = 'Bench processChunked instead of the in-memory stages')
+  parser.add_argument('--memory', action = 'store_true', help = 'Trace Python allocations per stage (slower)')
+  parser.add_argument('--out', default = 'bench.jsonl', help = 'JSON lines file the records are appended to')
+  parser.add_argument('--baseline', default = None, help = 'Revision in --out to compare against')
+  parser.add_argument('--keep', action = 'store_true', help = 'Keep the synthetic captures and outputs')
+  parser.add_argument('--startup', action = 'store_true', help = 'Only time the CLIs starting up against their budget')
+  args = parser.parse_args()
+
+  if args.startup:
+    records = save(startup(keep = args.keep), args.out)
+    sys.exit(any(record['wall'] > record['budget'] for record in records))
+
+  records = bench(
+    [int(size) for size in args.sizes.split(',')], out = args.out,
+    mix = parseMix(args.mix) if args.mix else None, formats = args.formats.split(','),
+    chunked = args.chunked, memory = args.memory, keep = args.keep,
+  )
+  baseline = None
+  if args.baseline is not None:
+    baseline = pd.read_json(args.out, lines = True)
+    baseline = baseline[baseline['rev'] == args.baseline]
+  print(summary(records, baseline).to_string(float_format = '{:.3f}'.format))
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+import hashlib
+import json
+import os
+
+import utils
+
+def loadMeta(fbase, name):
+  fpath = utils.metaPath(fbase, name)
+  if not os.path.isfile(fpath):
+    return {}
+  with open(fpath) as fin:
+    return json.load(fin)
+
+def saveMeta(fbase, name, meta):
+  with open(utils.metaPath(fbase, name), 'w') as fout:
+    json.dump(meta, fout, indent = 2)
+
+def fileFingerprint(fpath, known = None):
+  # Only rehash when size or mtime changed since the fingerprint we already know
+  stat = os.stat(fpath)
+  fingerprint = { 'size': stat.st_size, 'mtime': stat.st_mtime_ns }
+  if known and all(known.get(k) == v for k, v in fingerprint.items()):
+    return known
+
+  print(f'[fileFingerprint] Hashing {fpath}')
+  h = hashlib.sha256()
+  with open(fpath, 'rb') as fin:
+    for block in iter(lambda: fin.read(1 << 20), b''):
+      h.update(block)
+  fingerprint['sha256'] = h.hexdigest()
+  return fingerprint
+
+def key(*parts):
+  return hashlib.sha256(json.dumps(parts, sort_keys = True).encode()).hexdigest()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+import ctypes
+import socket
+import struct
+import time
+
+import pcapio
+
+ETH_P_ALL = 0x0003
+SOL_PACKET = 263
+PACKET_STATISTICS = 6
+SO_ATTACH_FILTER = 26
+SO_TIMESTAMPNS = 35
+SNAPLEN = 0xFFFF
+
+#************************************************************
+#* Socket ***************************************************
+
+def openSocket(iface = None, *, rcvbuf = 1 << 24):
+  sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+  if iface is not None:
+    sock.bind((iface, 0))
+  sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+  sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1) # Kernel receive time comes with each frame
+  return sock
+
+def compileFilter(expr, iface = None):
+  # libpcap (through scapy) turns the expression into classic BPF instructions
+  from scapy.arch.common import compile_filter
+  bpf = compile_filter(expr, iface)
+  return [(insn.code, insn.jt, insn.jf, insn.k) for insn in bpf.bf_insns[:bpf.bf_len]]
+
+def attachFilter(sock, program):
+  if isinstance(sock, ReplaySocket):
+    sock.program = program
+    return
+  insns = ctypes.create_string_buffer(b''.join(struct.pack('HBBI', *insn) for insn in program))
+  sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, struct.pack('HL', len(program), ctypes.addressof(insns)))
+
+def kernelStats(sock):
+  # Counters since the last call, reading them resets them
+  packets, drops = struct.unpack('II', sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+  return packets, drops
+
+#************************************************************
+#* Capture **************************************************
+
+def capture(sock, writer, *, count = None, timeout = None, callback = None):
+  stats = { 'written': 0, 'received': 0, 'dropped': 0 }
+  sock.settimeout(0.5)
+  start = time.time()
+  try:
+    while (count is None or stats['written'] < count) and (timeout is None or time.time() - start < timeout):
+      try:
+        frame, ancdata, _, _ = sock.recvmsg(SNAPLEN, socket.CMSG_SPACE(16))
+      except socket.timeout:
+        continue
+      except EOFError: # Only a ReplaySocket ends
+        break
+
+      writer.write(frame, _stamp(ancdata))
+      stats['written'] += 1
+      if callback is not None:
+        callback(frame, stats)
+  except KeyboardInterrupt:
+    pass
+
+  received, dropped = kernelStats(sock)
+  stats['received'] += received; stats['dropped'] += dropped
+  return stats
+
+def _stamp(ancdata):
+  for level, kind, data in ancdata:
+    if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+      sec, nsec = struct.unpack('qq', data[:16])
+      return sec + nsec * 1e-9
+  return time.time()
+
+#************************************************************
+#* Replay ***************************************************
+
+class ReplaySocket:
+  # Stands in for the AF_PACKET socket, serving the frames of a pcap so capture() can run offline
+  def __init__(self, fpath):
+    self.frames = pcapio.iterFrames(fpath)
+    self.program = None
+    self.received = 0
+    self.dropped = 0
+
+  def recvmsg(self, bufsize, ancbufsize = 0):
+    for stamp, frame, _ in self.frames:
+      self.received += 1
+      if self.program is not None and not runFilter(self.program, frame):
+        continue
+      sec = int(stamp)
+      ancdata = [(socket.SOL_SOCKET, SO_TIMESTAMPNS, struct.pack('qq', sec, int(round((stamp - sec) * 1e9))))]
+      return frame[:bufsize], ancdata, 0, ('replay', ETH_P_ALL, 0, 1, b'')
+    raise EOFError
+
+  def getsockopt(self, level, option, buflen = 0):
+    stats = struct.pack('II', self.received, self.dropped)
+    self.received = 0; self.dropped = 0
+    return stats
+
+  def setsockopt(self, *args):
+    pass
+  def settimeout(self, value):
+    pass
+  def close(self):
+    pass
+
+def runFilter(program, frame):
+  # Classic BPF interpreter, enough to run what libpcap compiles for Ethernet
+  A = X = pc = 0
+  M = [0] * 16
+  def load(k, size):
+    if k < 0 or k + size > len(frame):
+      raise IndexError
+    return int.from_bytes(frame[k:k + size], 'big')
+
+  try:
+    while True:
+      code, jt, jf, k = program[pc]
+      pc += 1
+      cls = code & 0x07
+      if cls in (0x00, 0x01): # LD, LDX
+        size = { 0x00: 4, 0x08: 2, 0x10: 1 }[code & 0x18]
+        mode = code & 0xE0
+        if mode == 0x00: v = k
+        elif mode == 0x20: v = load(k, size)
+        elif mode == 0x40: v = load(X + k, size)
+        elif mode == 0x60: v = M[k]
+        elif mode == 0x80: v = len(frame)
+        elif mode == 0xA0: v = (load(k, 1) & 0x0F) * 4 # MSH
+        if cls == 0x00: A = v
+        else: X = v
+      elif cls == 0x02: M[k] = A
+      elif cls == 0x03: M[k] = X
+      elif cls == 0x04: # ALU
+        v = X if code & 0x08 else k
+        op = code & 0xF0
+        A = {
+          0x00: lambda: A + v, 0x10: lambda: A - v, 0x20: lambda: A * v, 0x30: lambda: A // v,
+          0x40: lambda: A | v, 0x50: lambda: A & v, 0x60: lambda: A << v, 0x70: lambda: A >> v,
+          0x80: lambda: -A, 0x90: lambda: A % v, 0xA0: lambda: A ^ v,
+        }[op]() & 0xFFFFFFFF
+      elif cls == 0x05: # JMP
+        v = X if code & 0x08 else k
+        op = code & 0xF0
+        if op == 0x00: pc += k; continue
+        cond = { 0x10: A == v, 0x20: A > v, 0x30: A >= v, 0x40: bool(A & v) }[op]
+        pc += jt if cond else jf
+      elif cls == 0x06: # RET
+        return (A if code & 0x10 else k) != 0
+      elif cls == 0x07: # MISC
+        if code & 0xF8 == 0x00: X = A
+        else: A = X
+  except (IndexError, ZeroDivisionError): # Out of bounds loads reject the frame, like the kernel does
+    return False
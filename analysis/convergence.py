@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+from statistics import NormalDist
+import math
+
+import pandas as pd
+import numpy as np
+
+import entropy
+
+# H has converged once the Miller–Madow estimate moved less than TOL bits over the last CHECKS checkpoints (one every STEP frames)
+# and the CONFIDENCE interval around it is at most TOL bits wide on each side
+TOL = 0.05
+STEP = 250
+CHECKS = 4
+CONFIDENCE = 0.95
+
+class Tracker:
+  # Plug-in H, its Miller–Madow correction and a delta method bound, fed one frame (add) or one chunk (update) at a time.
+  # Keeps S = sum c log2 c and S2 = sum c log2^2 c so every frame only moves its own symbol's terms
+  def __init__(self, *, tol = TOL, step = STEP, checks = CHECKS, confidence = CONFIDENCE):
+    self.tol, self.step, self.checks = tol, step, checks
+    self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    self.counts = {}
+    self.n = 0
+    self.S = 0.0
+    self.S2 = 0.0
+    self.K = 0 # Symbols seen
+    self.history = [] # Miller–Madow H of the last checkpoints
+    self.convergedAt = None # Frames it took to converge
+
+  def add(self, code):
+    c = self.counts.get(code, 0)
+    self.S += _xlog2x(c + 1) - _xlog2x(c)
+    self.S2 += _xlog2sqx(c + 1) - _xlog2sqx(c)
+    self.K += c == 0
+    self.counts[code] = c + 1
+    self.n += 1
+    if self.n % self.step == 0:
+      _, H_mm, halfWidth = self.estimate()
+      self.check(self.n, H_mm, halfWidth)
+    return self
+
+  def estimate(self):
+    # (H, H_mm, half width of the interval)
+    H, H_mm, halfWidth = _estimate(np.array([self.n]), np.array([self.S]), np.array([self.S2]), np.array([self.K]), self.z)
+    return float(H[0]), float(H_mm[0]), float(halfWidth[0])
+
+  def update(self, codes):
+    # Same as add() for every code of the chunk, returns H, H_mm and the bounds of each frame
+    codes = np.asarray(codes)
+    uniq, inv = np.unique(codes, return_inverse = True)
+    inv = inv.reshape(-1)
+    prior = np.array([self.counts.get(code, 0) for code in uniq.tolist()], dtype = np.int64)
+    occ = entropy.occurrences(inv) + prior[inv]
+
+    n = self.n + np.arange(1, len(codes) + 1)
+    S = self.S + np.cumsum(entropy.xlog2x(occ) - entropy.xlog2x(occ - 1))
+    S2 = self.S2 + np.cumsum(_xlog2sq(occ) - _xlog2sq(occ - 1))
+    K = self.K + np.cumsum(occ == 1)
+    H, H_mm, halfWidth = _estimate(n, S, S2, K, self.z)
+
+    for i in np.flatnonzero(n % self.step == 0):
+      self.check(int(n[i]), H_mm[i], halfWidth[i])
+    for code, count in zip(uniq.tolist(), (prior + np.bincount(inv, minlength = len(uniq))).tolist()):
+      self.counts[code] = count
+    if len(codes):
+      self.n, self.S, self.S2, self.K = int(n[-1]), float(S[-1]), float(S2[-1]), int(K[-1])
+    return pd.DataFrame({ 'H': H, 'H_mm': H_mm, 'lo': H_mm - halfWidth, 'hi': H_mm + halfWidth })
+
+  def check(self, n, H_mm, halfWidth):
+    self.history = (self.history + [H_mm])[-self.checks:]
+    stable = len(self.history) == self.checks and max(self.history) - min(self.history) <= self.tol
+    if self.convergedAt is None and stable and halfWidth <= self.tol:
+      self.convergedAt = n
+
+  def replay(self, fooDf):
+    # check() at the checkpoints of a chunk of foo that follows the frames replayed so far, its H_mm and bounds are already computed
+    H_mm, halfWidth = fooDf['H_mm'].to_numpy(), (fooDf['hi'] - fooDf['lo']).to_numpy() / 2
+    n = self.n + np.arange(1, len(fooDf) + 1)
+    for i in np.flatnonzero(n % self.step == 0):
+      self.check(int(n[i]), H_mm[i], halfWidth[i])
+    self.n += len(fooDf)
+    return self
+
+  @property
+  def converged(self):
+    return self.convergedAt is not None
+
+def _estimate(n, S, S2, K, z):
+  # Var(H) ~ (sum p log2^2 p - H^2) / n, with sum p log2^2 p = S2/n - 2 log2(n) S/n + log2^2(n)
+  L = np.log2(n)
+  H = L - S / n
+  var = np.maximum(S2 / n - 2 * L * S / n + L * L - H * H, 0.0) / n
+  H_mm = H + (K - 1) / (2 * n * math.log(2))
+  return H, H_mm, z * np.sqrt(var)
+
+def _xlog2x(x):
+  return x * math.log2(x) if x > 0 else 0.0
+
+def _xlog2sqx(x):
+  return x * math.log2(x) ** 2 if x > 0 else 0.0
+
+def _xlog2sq(x):
+  x = np.asarray(x, dtype = np.float64)
+  return x * np.log2(x, out = np.zeros_like(x), where = x > 0) ** 2
+
+#************************************************************
+#* Offline **************************************************
+
+def convergedAt(fooDf, **params):
+  # Frames until H converged from the H_mm, lo and hi columns of fooDf, None if it never did
+  return Tracker(**params).replay(fooDf).convergedAt
+
+def bootstrap(counts, *, samples = 200, confidence = CONFIDENCE, seed = 0):
+  # Percentile interval of the plug-in H over multinomial resamples of counts
+  counts = np.asarray(counts, dtype = np.int64)
+  n = counts.sum()
+  if not n:
+    return 0.0, 0.0
+  resamples = np.random.default_rng(seed).multinomial(n, counts / n, size = samples)
+  p = resamples / n
+  H = -(p * np.log2(p, out = np.zeros_like(p), where = p > 0)).sum(axis = 1)
+  alpha = (1 - confidence) / 2
+  lo, hi = np.quantile(H, [alpha, 1 - alpha])
+  return float(lo), float(hi)
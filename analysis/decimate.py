@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import numpy as np
+
+POINTS = 2000 # Per trace, about what fits across a figure anyway
+
+def decimate(y, points = None, *, method = 'lttb'):
+  # Returns (x, y) with x the original positions of the points kept
+  y = np.asarray(y, dtype = np.float64)
+  points = points or POINTS
+  if len(y) <= points:
+    return np.arange(len(y)), y
+  idx = METHODS[method](y, points)
+  return idx, y[idx]
+
+class Decimator:
+  # decimate() of n values that arrive in batches, each batch gets its share of the points and keeps its last value
+  def __init__(self, n, points = None, *, method = 'lttb'):
+    self.n, self.points, self.method = n, points or POINTS, method
+    self.xs, self.ys = [], []
+    self.seen = 0
+
+  def add(self, y):
+    y = np.asarray(y, dtype = np.float64)
+    x, y_ = decimate(y, max(2, -(-self.points * len(y) // max(self.n, 1))), method = self.method)
+    self.xs.append(x + self.seen); self.ys.append(y_)
+    self.seen += len(y)
+    return self
+
+  def result(self):
+    if not self.xs:
+      return np.arange(0), np.empty(0)
+    return np.concatenate(self.xs), np.concatenate(self.ys)
+
+def lttb(y, points):
+  # Largest triangle three buckets, keeps the first and last points and one per bucket in between
+  edges = np.linspace(1, len(y) - 1, points - 1).astype(np.int64)
+  idx = np.empty(points, dtype = np.int64)
+  idx[0], idx[-1] = 0, len(y) - 1
+
+  a = 0
+  for i in range(points - 2):
+    start, end = edges[i], edges[i + 1]
+    nextEnd = edges[i + 2] if i + 2 < len(edges) else len(y)
+    cx = (edges[i + 1] + nextEnd - 1) / 2 # Average of the next bucket
+    cy = y[edges[i + 1]:nextEnd].mean()
+
+    xs = np.arange(start, end)
+    area = np.abs((a - cx) * (y[start:end] - y[a]) - (a - xs) * (cy - y[a]))
+    a = start + int(np.argmax(area))
+    idx[i + 1] = a
+  return idx
+
+def minmax(y, points):
+  # Min and max of each bucket, so spikes survive
+  buckets = np.minimum(np.arange(len(y)) * (points // 2) // len(y), points // 2 - 1)
+  order = np.lexsort((y, buckets))
+  starts = np.searchsorted(buckets[order], np.arange(points // 2))
+  ends = np.r_[starts[1:], len(y)] - 1
+  return np.unique(np.r_[order[starts], order[ends], 0, len(y) - 1])
+
+METHODS = {
+  'lttb': lttb,
+  'minmax': minmax,
+}
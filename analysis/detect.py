@@ -0,0 +1,172 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from collections import deque
+import math
+import socket
+
+import pandas as pd
+import numpy as np
+
+import extract
+import symtab
+
+# Every check is O(1) amortized per frame: windows are deques, each frame enters and leaves them once,
+# and the divergence (O(symbols)) is only recomputed every STEP frames, which bounds how late its alert can be
+WINDOW = 1000 # Frames in the reference and in the recent window, the reference is the WINDOW frames before the recent ones
+STEP = 100
+DIVERGENCE = 0.1 # Jensen–Shannon, bits
+ARP_WINDOW = 1.0 # Seconds
+ARP_RATE = 50 # ARP frames per second
+HOST_WINDOW = 10.0 # Seconds
+NEW_HOSTS = 10 # IPs never seen before within HOST_WINDOW
+WARMUP = 30.0 # Seconds during which every host is new, no new host alerts
+ARP_TYPE = 0x0806
+
+class Detector:
+  # Distribution shifts of the symbol stream, ARP storms and bursts of new hosts, one frame at a time.
+  # An alert fires when its value crosses the threshold and fires again only after it went back under half of it
+  def __init__(self, fields = None, *, window = WINDOW, step = STEP, divergence = DIVERGENCE, arpWindow = ARP_WINDOW, arpRate = ARP_RATE,
+               hostWindow = HOST_WINDOW, newHosts = NEW_HOSTS, warmup = WARMUP, onAlert = None):
+    self.fields = list(fields or symtab.DEFAULT)
+    self.window, self.step, self.divergence = window, step, divergence
+    self.arpWindow, self.arpRate = arpWindow, arpRate
+    self.hostWindow, self.newHosts, self.warmup = hostWindow, newHosts, warmup
+    self.onAlert = onAlert
+
+    self.n = 0
+    self.t0 = None
+    self.recent, self.recentCounts = deque(), {}
+    self.reference, self.referenceCounts = deque(), {}
+    self.arps = deque() # (time, psrc) of the ARP frames in the last arpWindow seconds
+    self.senders = {} # psrc -> frames in self.arps
+    self.hosts = set()
+    self.newHostTimes = deque()
+    self.active = set() # Kinds over their threshold right now
+    self.alerts = []
+
+  def add(self, code, time, arp = None):
+    # arp is (psrc, pdst) for ARP frames
+    self.t0 = time if self.t0 is None else self.t0
+    t = time - self.t0
+
+    self.recent.append(code)
+    self.recentCounts[code] = self.recentCounts.get(code, 0) + 1
+    if len(self.recent) > self.window: # Oldest recent frame moves to the reference
+      old = self.recent.popleft()
+      _dec(self.recentCounts, old)
+      self.reference.append(old)
+      self.referenceCounts[old] = self.referenceCounts.get(old, 0) + 1
+      if len(self.reference) > self.window:
+        _dec(self.referenceCounts, self.reference.popleft())
+    if self.n % self.step == 0 and len(self.reference) == self.window:
+      js, code = jsDivergence(self.referenceCounts, self.recentCounts)
+      self.check('divergence', js, self.divergence, t, lambda: self.shift(code))
+
+    if arp is not None:
+      psrc, pdst = arp
+      self.arps.append((t, psrc))
+      self.senders[psrc] = self.senders.get(psrc, 0) + 1
+      new = [ip for ip in (psrc, pdst) if ip != '0.0.0.0' and ip not in self.hosts]
+      self.hosts.update(new)
+      if t >= self.warmup:
+        self.newHostTimes.extend([t] * len(new))
+    while self.arps and t - self.arps[0][0] > self.arpWindow:
+      _dec(self.senders, self.arps.popleft()[1])
+    while self.newHostTimes and t - self.newHostTimes[0] > self.hostWindow:
+      self.newHostTimes.popleft()
+    if arp is not None:
+      self.check('arpStorm', len(self.arps) / self.arpWindow, self.arpRate, t, lambda: f'top sender {max(self.senders, key = self.senders.get)}')
+      self.check('newHosts', len(self.newHostTimes), self.newHosts, t, lambda: f'{len(self.hosts)} hosts so far')
+
+    self.n += 1
+    return self
+
+  def check(self, kind, value, threshold, t, detail):
+    # detail is only built for alerts
+    if kind in self.active:
+      if value < threshold / 2:
+        self.active.discard(kind)
+      return
+    if value >= threshold:
+      self.active.add(kind)
+      alert = { 'frame': self.n, 't': t, 'kind': kind, 'value': value, 'detail': detail() }
+      self.alerts.append(alert)
+      if self.onAlert is not None:
+        self.onAlert(alert)
+
+  def shift(self, code):
+    p = self.referenceCounts.get(code, 0) / len(self.reference)
+    q = self.recentCounts.get(code, 0) / len(self.recent)
+    return f'{symtab.label(code, self.fields)} {p:.2f} -> {q:.2f}'
+
+  def update(self, pcapDf, optDf):
+    # The frames of a pcap and an opt chunk (or whole DataFrames) from the same frames, ARP rows are in the order of the ARP frames
+    codes = symtab.project(pcapDf['code'], self.fields)
+    isArp = np.flatnonzero(symtab.field(np.asarray(pcapDf['code'], dtype = symtab.DTYPE), 'ethertype') == ARP_TYPE)
+    arps = dict(zip(isArp.tolist(), zip(optDf['psrc'].astype(str).tolist(), optDf['pdst'].astype(str).tolist())))
+    for i, (code, time) in enumerate(zip(codes.tolist(), pcapDf['dt'].tolist())):
+      self.add(code, time, arps.get(i))
+    return self
+
+  def alertsDf(self):
+    return pd.DataFrame(self.alerts, columns = ['frame', 't', 'kind', 'value', 'detail'])
+
+def _dec(counts, key):
+  counts[key] -= 1
+  if not counts[key]:
+    del counts[key]
+
+def jsDivergence(p, q):
+  # Jensen–Shannon divergence in bits between two {symbol: count}, plus the symbol whose share changed the most
+  np_, nq = sum(p.values()), sum(q.values())
+  js, top, topDiff = 0.0, None, -1.0
+  for symbol in p.keys() | q.keys():
+    a, b = p.get(symbol, 0) / np_, q.get(symbol, 0) / nq
+    m = (a + b) / 2
+    js += (a * math.log2(a / m) if a else 0.0) + (b * math.log2(b / m) if b else 0.0)
+    if abs(a - b) > topDiff:
+      top, topDiff = symbol, abs(a - b)
+  return js / 2, top
+
+def arpOf(frame):
+  # (psrc, pdst) of an Ethernet/IPv4 ARP frame, same bytes pcapio.arpFields reads
+  if len(frame) < 42 or frame[12:14] != b'\x08\x06':
+    return None
+  return socket.inet_ntoa(frame[28:32]), socket.inet_ntoa(frame[38:42])
+
+#************************************************************
+#* Offline **************************************************
+
+def fromPcap(fpath, fields = None, **params):
+  detector = Detector(fields, **params)
+  for dfs in extract.iterScan(fpath, ['pcap', 'opt']):
+    detector.update(dfs['pcap'], dfs['opt'])
+  return detector
+
+def fromExperiment(experiment, **params):
+  # From the cached pcap and opt stages, with the experiment's symbols
+  return Detector(experiment.params['symbols']['fields'], **params).update(experiment.pcapDf, experiment.optDf)
+
+if __name__ == '__main__':
+  parser = ArgumentParser(
+    prog = 'detect',
+    description = 'Runs the online detector over a recorded capture',
+  )
+  parser.add_argument('experiment', nargs = '*', help = '{USER} {EXPERIMENT_NAME}, from its cached stages')
+  parser.add_argument('--pcap', default = None, help = 'Read this pcap instead of an experiment')
+  parser.add_argument('--symbols', default = None, help = 'Comma separated symbol fields, like analyze.py')
+  parser.add_argument('--window', type = int, default = WINDOW, help = 'Frames in the reference and recent windows')
+  parser.add_argument('--divergence', type = float, default = DIVERGENCE, help = 'Jensen–Shannon divergence (bits) that raises an alert')
+  parser.add_argument('--arp-rate', type = float, default = ARP_RATE, help = 'ARP frames per second that count as a storm')
+  parser.add_argument('--new-hosts', type = int, default = NEW_HOSTS, help = f'New IPs within {HOST_WINDOW:g}s that count as a burst')
+  args = parser.parse_args()
+
+  symbols = args.symbols.split(',') if args.symbols else None
+  params = { 'window': args.window, 'divergence': args.divergence, 'arpRate': args.arp_rate, 'newHosts': args.new_hosts, 'onAlert': print }
+  if args.pcap is not None:
+    detector = fromPcap(args.pcap, symbols, **params)
+  else:
+    from experiment import Experiment
+    detector = fromExperiment(Experiment(*args.experiment, symbols = symbols), **params)
+  print(f'[detect] {detector.n} frames, {len(detector.alerts)} alerts')
+  print(detector.alertsDf().to_string(index = False))
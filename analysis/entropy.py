@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+import pandas as pd
+import numpy as np
+
+import math
+
+def cumulativeDf(codes, symbols, *, perSymbol = True, state = None):
+  # codes[i] is the index in symbols of the i-th frame's symbol, state carries the counts of previous chunks and is updated
+  codes = np.asarray(codes)
+  state = state if state is not None else newState(len(symbols))
+  total = state['n'] + np.arange(1, len(codes) + 1)
+  columns = {}
+
+  if perSymbol:
+    hits = codes[:, None] == np.arange(len(symbols))
+    counts = state['counts'] + hits.cumsum(axis = 0)
+    p = counts / total[:, None]
+    I = -np.log2(p, out = np.full(p.shape, -0.0), where = p > 0) # I = 0 for symbols not seen yet
+    H = p * I
+
+    for i, symbol in enumerate(symbols):
+      columns[symbol] = hits[:, i].astype(np.int64)
+    for i, symbol in enumerate(symbols):
+      columns[f'{symbol}_count'] = counts[:, i]
+      columns[f'{symbol}_p'] = p[:, i]
+      columns[f'{symbol}_I'] = I[:, i]
+      columns[f'{symbol}_H'] = H[:, i]
+
+  columns['H'] = runningEntropy(codes, state)
+  return pd.DataFrame(columns)
+
+def newState(nSymbols):
+  return { 'counts': np.zeros(nSymbols, dtype = np.int64), 'n': 0, 'S': 0.0 }
+
+def runningEntropy(codes, state = None):
+  # H_n = log2(n) - S_n / n with S_n = sum_s c_s log2(c_s), each frame only moves its own symbol's term
+  codes = np.asarray(codes)
+  occ = occurrences(codes)
+  if state is not None:
+    occ += state['counts'][codes]
+  S = np.cumsum(xlog2x(occ) - xlog2x(occ - 1))
+  total = np.arange(1, len(codes) + 1)
+
+  if state is not None:
+    S += state['S']; total += state['n']
+    state['counts'] += np.bincount(codes, minlength = len(state['counts']))
+    state['n'] += len(codes)
+    state['S'] = S[-1] if len(codes) else state['S']
+  return np.log2(total) - S / total
+
+def symbolsDf(counts):
+  # counts is {symbol: count} in order of first appearance
+  df = pd.DataFrame({ 'symbol': list(counts), 'count': list(counts.values()) })
+  df['p'] = df['count'] / df['count'].sum()
+  df['information'] = -np.log2(df['p'])
+  return df[['symbol', 'p', 'count', 'information']]
+
+def occurrences(codes):
+  # How many times each frame's symbol has been seen so far, itself included
+  order = np.argsort(codes, kind = 'stable')
+  starts = np.flatnonzero(np.r_[True, np.diff(codes[order]) != 0])
+  runStart = np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+  occ = np.empty(len(codes), dtype = np.int64)
+  occ[order] = np.arange(len(codes)) - runStart + 1
+  return occ
+
+def xlog2x(x):
+  x = np.asarray(x, dtype = np.float64)
+  return x * np.log2(x, out = np.zeros_like(x), where = x > 0)
+
+class RunningEntropy:
+  # Symbol counts and H updated in O(1) per frame, same identity as runningEntropy
+  def __init__(self):
+    self.counts = {}
+    self.n = 0
+    self.S = 0.0
+
+  def update(self, symbol):
+    c = self.counts.get(symbol, 0)
+    self.S += _xlog2x(c + 1) - _xlog2x(c)
+    self.counts[symbol] = c + 1
+    self.n += 1
+
+  @property
+  def H(self):
+    return math.log2(self.n) - self.S / self.n if self.n else 0.0
+
+  def symbolsDf(self):
+    return symbolsDf(self.counts)
+
+def _xlog2x(x):
+  return x * math.log2(x) if x > 0 else 0.0
+
+def windowedDf(codes, dt, symbols, *, windows = (), decays = (), step = None, decayStep = 1):
+  # Entropy over time windows [t - w, t) ending every `step` seconds (tumbling when step is None) and over exponentially decayed counts
+  codes, dt = np.asarray(codes), np.asarray(dt, dtype = np.float64)
+  order = np.argsort(dt, kind = 'stable') # Captures can have frames out of order
+  codes, dt = codes[order], dt[order]
+  frames = []
+  for w in windows:
+    grid = _grid(dt, step or w)
+    counts = _countsUntil(codes, dt, len(symbols), grid) - _countsUntil(codes, dt, len(symbols), grid - w)
+    frames.append(_windowFrame(f'{w}s', grid, counts, symbols))
+  for tau in decays:
+    grid = _grid(dt, decayStep)
+    frames.append(_windowFrame(f'ewm{tau}s', grid, _decayedCounts(codes, dt, len(symbols), grid, tau), symbols))
+  return pd.concat(frames, ignore_index = True)
+
+def _grid(dt, step):
+  # Ends of the windows, the last one after every frame (a capture shorter than step still gets one)
+  if not len(dt):
+    return np.array([])
+  start = min(dt[0], 0.0)
+  return start + np.arange(1, np.floor((dt[-1] - start) / step) + 2) * step
+
+def _countsUntil(codes, dt, nSymbols, times):
+  # counts[j, s] = frames of symbol s with dt < times[j], dt is sorted so it's a searchsorted per symbol
+  counts = np.empty((len(times), nSymbols))
+  for s in range(nSymbols):
+    counts[:, s] = np.searchsorted(dt[codes == s], times, side = 'left')
+  return counts
+
+def _decayedCounts(codes, dt, nSymbols, grid, tau):
+  # Every frame adds exp(-age / tau), carried from one grid point to the next with the same factor
+  j = np.searchsorted(grid, dt, side = 'right') # First point after the frame, like the windows
+  inside = j < len(grid)
+  weights = np.exp(-(grid[j[inside]] - dt[inside]) / tau)
+  added = np.bincount(j[inside] * nSymbols + codes[inside], weights, minlength = len(grid) * nSymbols).reshape(len(grid), nSymbols)
+
+  counts = np.empty_like(added)
+  carry, decay = np.zeros(nSymbols), np.exp(-np.diff(grid, prepend = 0) / tau)
+  for i in range(len(grid)):
+    carry = carry * decay[i] + added[i]
+    counts[i] = carry
+  return counts
+
+def _windowFrame(window, t, counts, symbols):
+  n = counts.sum(axis = 1)
+  with np.errstate(invalid = 'ignore', divide = 'ignore'):
+    p = counts / n[:, None] # NaN for windows without frames
+    I = np.where(p > 0, 0.0 - np.log2(p), 0.0)
+  H = np.where(n > 0, (p * I).sum(axis = 1), np.nan)
+
+  columns = { 'window': window, 't': t, 'n': n, 'H': H }
+  for i, symbol in enumerate(symbols):
+    columns[f'{symbol}_p'] = p[:, i]
+    columns[f'{symbol}_I'] = np.where(n > 0, I[:, i], np.nan)
+  return pd.DataFrame(columns)
@@ -1,29 +1,81 @@
 #!/usr/bin/env python3
-import scapy.all as scapy
-import pandas as pd
-import numpy as np
-
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-
 from datetime import datetime
 from time import time
-import sys
 import os
 
+import aggregate
+import cache
+import instrument
+import render
+import store
 import utils
 
+# Only what a run whose stages and report are cached needs is imported up front
+scapy = utils.lazyImport('scapy.all')
+pd = utils.lazyImport('pandas')
+np = utils.lazyImport('numpy')
+go = utils.lazyImport('plotly.graph_objects')
+px = utils.lazyImport('plotly.express')
+arp = utils.lazyImport('arp')
+capture = utils.lazyImport('capture')
+convergence = utils.lazyImport('convergence')
+decimate = utils.lazyImport('decimate')
+detect = utils.lazyImport('detect')
+entropy = utils.lazyImport('entropy')
+extract = utils.lazyImport('extract')
+pcapio = utils.lazyImport('pcapio')
+symtab = utils.lazyImport('symtab')
+
 class Experiment:
-  def __init__(self, user, name):
+  # stage -> DataFrame attribute, method that builds it, what it's computed from and a version to bump when that method changes
+  STAGES = {
+    'pcap': { 'df': 'pcapDf', 'get': 'getPcapDf', 'inputs': ['file'], 'version': 3 },
+    'symbols': { 'df': 'symbolsDf', 'get': 'getSymbolsDf', 'inputs': ['pcap'], 'version': 3 },
+    'foo': { 'df': 'fooDf', 'get': 'getFooDf', 'inputs': ['pcap', 'symbols'], 'version': 2 },
+    'opt': { 'df': 'optDf', 'get': 'getOptDf', 'inputs': ['file'], 'version': 1 },
+    'window': { 'df': 'windowDf', 'get': 'getWindowDf', 'inputs': ['pcap', 'symbols'], 'version': 2 },
+  }
+  REPORT_VERSION = 2 # Bump when what report() writes changes
+  TOP_SYMBOLS = 50 # Most bars a plot gets
+
+  def __init__(self, user, name, *, symbols = None, frames = None, seconds = None, untilConverged = False):
     self.user = user; self.name = name
     self.fbase = utils.experimentName(user, name)
+    self.scans = {}
+    self.metrics = instrument.Recorder(self.fbase)
+    # Part of the capture to analyze, (start, stop) frame numbers and/or seconds since the first frame. Empty is all of it
+    self.scope = { k: list(v) for k, v in { 'frames': frames, 'seconds': seconds }.items() if v is not None }
+    # Stop reading the capture once H converged, see convergence.py
+    self.untilConverged = untilConverged
+    early = { 'untilConverged': True } if untilConverged else {}
+    self.params = {
+      'pcap': { **self.scope, **early },
+      'opt': { **self.scope, **early },
+      'symbols': { 'fields': list(symbols or ['dire', 'ethertype']) }, # symtab.DEFAULT, fields from symtab.FIELDS
+      'foo': { 'perSymbol': True, 'convergence': {} }, # convergence.Tracker arguments, {} for its defaults
+      'window': { 'windows': [1, 10, 60], 'decays': [10], 'step': None }, # Seconds
+    }
     self.mkDir()
 
+  def __getattr__(self, attr):
+    # Stages skipped by process() because their cache is fresh are only loaded when something uses them
+    for stage, info in Experiment.STAGES.items():
+      if attr == info['df']:
+        with self.metrics.span(stage, cache = 'hit' if self.isFresh(stage) else 'miss') as span:
+          getattr(self, info['get'])()
+          span['rows'] = len(self.__dict__[attr])
+        return self.__dict__[attr]
+    raise AttributeError(attr)
+
   #************************************************************
   #* Sniff ****************************************************
 
-  def sniff(self, *, save = True):
+  def sniff(self, *, save = True, live = False, backend = 'scapy', **kwargs):
+    if backend == 'raw':
+      return self.sniffRaw(**kwargs)
+    if live:
+      return self.sniffLive(save = save, **kwargs)
+
     print(f'[{self.fbase}.sniff]: now={datetime.now()}\nPress Ctrl+C to stop')
     self.totalPkts = 0
     self.pcap = scapy.sniff(
@@ -40,135 +92,362 @@ class Experiment:
     if (self.totalPkts % 10) == 0:
       print(f'\rtotalPkts={self.totalPkts}', end = '')
 
+  def sniffLive(self, *, save = True, interval = 1, chunkPackets = 10000, ringSize = None, untilConverged = False, alerts = False):
+    # Nothing is kept in memory, frames go to a ring of pcap chunks and only the symbol counts are updated
+    print(f'[{self.fbase}.sniffLive]: now={datetime.now()}\nPress Ctrl+C to stop')
+    self.live = entropy.RunningEntropy()
+    self.liveTracker = convergence.Tracker(**self.params['foo']['convergence'])
+    self.liveMask = symtab.mask(self.params['symbols']['fields'])
+    self.detector = detect.Detector(self.params['symbols']['fields'], onAlert = self.alertCallback) if alerts else None
+    self.ring = pcapio.ChunkRing(utils.livePath(self.fbase), chunkPackets = chunkPackets, ringSize = ringSize)
+    self.lastSummary = time()
+    scapy.sniff(
+      lfilter = lambda pkt: isinstance(pkt, scapy.Ether),
+      prn = lambda pkt: self.liveCallback(pkt, interval),
+      stop_filter = lambda pkt: untilConverged and self.liveTracker.converged,
+      store = False,
+    )
+    self.ring.close()
+
+    print(f'\n[{self.fbase}.sniffLive] totalPkts={self.live.n}, H={self.live.H}, convergedAt={self.liveTracker.convergedAt}')
+    if not self.live.n:
+      print(f'[{self.fbase}.sniffLive] Nothing was captured')
+    print(self.liveSymbolsDf().sort_values('information', ascending = False).to_string(index = False))
+    if save:
+      store.save(self.liveSymbolsDf(), self.fbase, 'live')
+      pcapio.catPcaps(self.ring.fpaths, utils.pcapPath(self.fbase))
+      for fpath in self.ring.fpaths:
+        os.remove(fpath)
+    return self
+
+  def liveCallback(self, pkt, interval):
+    frame = bytes(pkt)
+    code = symtab.frameCode(frame)
+    if code is None:
+      return
+
+    self.live.update(code & self.liveMask)
+    self.liveTracker.add(code & self.liveMask)
+    if self.detector is not None:
+      self.detector.add(code & self.liveMask, float(pkt.time), detect.arpOf(frame))
+    self.ring.write(frame, float(pkt.time), pkt.wirelen)
+    if time() - self.lastSummary >= interval:
+      self.lastSummary = time()
+      _, H_mm, halfWidth = self.liveTracker.estimate()
+      print(f'\rtotalPkts={self.live.n} H={self.live.H:.4f} H_mm={H_mm:.4f}±{halfWidth:.4f} symbols={len(self.live.counts)}', end = '')
+
+  def alertCallback(self, alert):
+    print(f'\n[{self.fbase}.alert] frame={alert["frame"]} t={alert["t"]:.3f}s {alert["kind"]}={alert["value"]:.3f} {alert["detail"]}')
+
+  def sniffRaw(self, *, iface = None, bpf = None, sock = None, count = None, timeout = None):
+    # AF_PACKET socket straight into the pcap, frames are never dissected. Pass a capture.ReplaySocket as sock to run it offline.
+    # bpf is an expression (compiled with libpcap) or an already compiled program, a list of (code, jt, jf, k) like tcpdump -dd prints
+    print(f'[{self.fbase}.sniffRaw]: now={datetime.now()} {iface=} {bpf=}\nPress Ctrl+C to stop')
+    sock = sock or capture.openSocket(iface)
+    try:
+      if bpf is not None:
+        capture.attachFilter(sock, capture.compileFilter(bpf, iface) if isinstance(bpf, str) else list(bpf))
+      with pcapio.PcapWriter(utils.pcapPath(self.fbase)) as writer:
+        self.captureStats = capture.capture(sock, writer, count = count, timeout = timeout, callback = self.rawCallback)
+    finally:
+      sock.close()
+    self.__dict__.pop('fingerprint', None)
+
+    print(f'\n[{self.fbase}.sniffRaw] {self.captureStats}')
+    return self
+
+  def rawCallback(self, frame, stats):
+    if (stats['written'] % 10) == 0:
+      print(f'\rtotalPkts={stats["written"]}', end = '')
+
+  def liveSymbolsDf(self):
+    return symtab.symbolsDf(self.live.counts, self.params['symbols']['fields'])
+
   #************************************************************
   #* Process **************************************************
 
-  def process(self, *, save = True, load = True):
-    print(f'[{self.fbase}.analyze] {save=}, {load=}')
-  
-    self.getPcapDf(save, load)
-    self.getSymbolsDf(save, load)
-    self.getFooDf(save, load)
-    self.getOptDf(save, load)
+  def process(self, *, save = True, load = True, chunked = False, blockSize = None):
+    print(f'[{self.fbase}.analyze] {save=}, {load=}, {chunked=}')
+    if chunked or self.untilConverged: # Only the chunked pass can stop reading early
+      return self.processChunked(load = load, blockSize = blockSize)
+
+    stale = [stage for stage in Experiment.STAGES if not (load and self.isFresh(stage))]
+    scanned = [stage for stage in stale if stage in extract.EXTRACTORS]
+    if scanned:
+      self.requirePcap(scanned)
+      with self.metrics.span('scan', cache = 'miss') as span:
+        self.scans = extract.scan(utils.pcapPath(self.fbase), scanned, **self.scope)
+        span['rows'] = sum(len(df) for df in self.scans.values())
+    for stage, info in Experiment.STAGES.items():
+      if stage not in stale:
+        print(f'[{self.fbase}.{stage}] fresh')
+        continue
+      with self.metrics.span(stage, cache = 'miss') as span:
+        getattr(self, info['get'])(save, load = False)
+        span['rows'] = len(getattr(self, info['df']))
+
+    self.aggregate()
+    self.metrics.flush()
+    return self
 
+  def processChunked(self, *, load = True, blockSize = None):
+    # Same pcap, symbols, foo and opt as process() but only one block of the capture is in memory at a time, results are appended to disk
+    stages = ['pcap', 'symbols', 'foo', 'opt']
+    blockSize = blockSize or pcapio.BLOCK_SIZE
+    if load and all(self.isFresh(stage) for stage in stages):
+      print(f'[{self.fbase}.processChunked] fresh')
+      return self
+    self.requirePcap(stages)
+
+    # Capture -> pcap and opt on disk, only the symbol counts stay in memory
+    counts, t0, n, nOpt = {}, None, 0, 0
+    tracker = convergence.Tracker(**self.params['foo']['convergence'])
+    with self.metrics.span('scan', cache = 'miss') as span, store.Appender(self.fbase, 'pcap') as pcapOut, store.Appender(self.fbase, 'opt') as optOut:
+      for dfs in extract.iterScan(utils.pcapPath(self.fbase), ['pcap', 'opt'], blockSize = blockSize, **self.scope):
+        df, optDf = dfs['pcap'], dfs['opt']
+        if self.untilConverged:
+          tracker.update(self.codes(df))
+          if tracker.converged: # The block goes on past that frame, only the frames up to it stay and the ARP rows among them
+            df = df.iloc[:tracker.convergedAt - n].copy()
+            isArp = symtab.field(np.asarray(df['code'], dtype = symtab.DTYPE), 'ethertype') == detect.ARP_TYPE
+            optDf = optDf.iloc[:np.count_nonzero(isArp)].copy()
+        if t0 is None and len(df):
+          t0 = df['dt'].iloc[0]
+        df['dt'] -= t0 if t0 is not None else 0.0
+        for code, count in symtab.counts(self.codes(df)).items(): # Keeps the order of first appearance, like getSymbolsDf
+          counts[code] = counts.get(code, 0) + count
+
+        df.index += n; n += len(df)
+        optDf.index += nOpt; nOpt += len(optDf)
+        pcapOut.append(df); optOut.append(optDf)
+        if tracker.converged:
+          print(f'[{self.fbase}.processChunked] H converged after {tracker.convergedAt} frames, stopping')
+          break
+      span['rows'] = n
+
+    self.symbolsDf = symtab.symbolsDf(counts, self.params['symbols']['fields'])
+    store.save(self.symbolsDf, self.fbase, 'symbols')
+
+    # pcap -> foo, the cumulative counts are carried from one batch to the next
+    symbols = list(self.symbolsDf['symbol'])
+    state, tracker, curve = entropy.newState(len(symbols)), convergence.Tracker(**self.params['foo']['convergence']), decimate.Decimator(n)
+    n = 0
+    with self.metrics.span('foo', cache = 'miss') as span, store.Appender(self.fbase, 'foo') as fooOut:
+      for batch in store.iterBatches(self.fbase, 'pcap', ['code']):
+        codes = symtab.indexOf(self.codes(batch), self.symbolsDf['code'])
+        df = self.cumulativeDf(codes, symbols, state, tracker)
+        df.index += n; n += len(df)
+        fooOut.append(df); curve.add(df['H'])
+      if not n: # An empty range has no batches, foo still has to replace the last one
+        fooOut.append(self.cumulativeDf(np.empty(0, dtype = np.int64), symbols, state, tracker))
+      span['rows'] = n
+
+    for stage in stages:
+      self.saveMeta(stage)
+    self.aggregate(curve.result(), tracker.convergedAt)
+    self.metrics.flush()
+    return self
+
+  def aggregate(self, curve = None, converged = None):
+    # Summary merge.py reads, only rewritten when foo changed. curve (decimated H) and converged come from the foo pass if it kept them,
+    # otherwise foo is read one batch at a time
+    key = cache.loadMeta(self.fbase, 'foo').get('key')
+    if key is not None and aggregate.key(self.fbase) == key:
+      return self
+    frames = int(self.symbolsDf['count'].sum())
+    if curve is None:
+      decimator, tracker = decimate.Decimator(frames), convergence.Tracker(**self.params['foo']['convergence'])
+      for df in self.iterDf('foo', ['H', 'H_mm', 'lo', 'hi'], store.ROWS):
+        decimator.add(df['H']); tracker.replay(df)
+      curve, converged = decimator.result(), tracker.convergedAt
+    aggregate.update(self.fbase, self.user, self.name, key, self.symbolsDf, curve, frames, converged)
     return self
 
   def getPcapDf(self, save = True, load = True):
-    fpath = utils.dfPath(self.fbase, 'pcap')
-    if load and os.path.isfile(fpath):
-      self.pcapDf = pd.read_csv(fpath, index_col = 0)
-      return
+    if self.loadDf('pcap', load):
+      return self
 
-    self.loadPcap()
-    # self.pcap = self.pcap[:min(20000, len(self.pcap))]
-    start_time = self.pcap[0].time
-    self.pcapDf = pd.DataFrame([
-			{
-				'dire': 'BROADCAST' if pkt[scapy.Ether].dst == 'ff:ff:ff:ff:ff:ff' else 'UNICAST',
-				'proto': utils.getTypeStr(pkt[scapy.Ether].type), # El campo type del frame tiene el protocolo
-				'dt': pkt.time - start_time,
-			}
-      for pkt in self.pcap
-      if pkt.haslayer(scapy.Ether)
-    ])
-    self.pcapDf['symbol'] = '(' + self.pcapDf['dire'] + ', ' + self.pcapDf['proto'] + ')'
+    self.pcapDf = self.scanned('pcap')
+    self.pcapDf['dt'] -= self.pcapDf['dt'].iloc[0] if len(self.pcapDf) else 0.0
 
     if save:
-      self.pcapDf.to_csv(fpath)
+      self.saveDf('pcap')
     return self
    
   def getSymbolsDf(self, save = True, load = True):
     #TODO: Repeated code with getPcapDf
-    fpath = utils.dfPath(self.fbase, 'symbols')
-    if load and os.path.isfile(fpath):
-      self.symbolsDf = pd.read_csv(fpath, index_col = 0)
-      return
+    if self.loadDf('symbols', load):
+      return self
 
-    counts = self.pcapDf['symbol'].value_counts()
-    self.symbolsDf = pd.DataFrame([
-      {
-        'symbol': symbol, 
-        'p': counts[symbol] / len(self.pcapDf),
-        'count': counts[symbol]
-      }
-      for symbol in list(self.pcapDf['symbol'].unique())
-    ])
-    self.symbolsDf['information'] = -np.log2(self.symbolsDf['p'])
+    self.symbolsDf = symtab.symbolsDf(symtab.counts(self.codes(self.pcapDf)), self.params['symbols']['fields'])
     
     if save:
-      self.symbolsDf.to_csv(fpath)
+      self.saveDf('symbols')
     return self
 
   def getOptDf(self, save = True, load = True):
     #TODO: Repeated code with getPcapDf
-    fpath = utils.dfPath(self.fbase, 'opt')
-    if load and os.path.isfile(fpath):
-      self.optDf = pd.read_csv(fpath, index_col = 0)
-      return
+    if self.loadDf('opt', load):
+      return self
   
-    self.loadPcap()
-    self.optDf = pd.DataFrame([
-      {
-        'ptype': pkt[scapy.ARP].ptype,
-        'psrc': pkt[scapy.ARP].psrc,
-        'pdst': pkt[scapy.ARP].pdst,
-        'hwtype': pkt[scapy.ARP].hwtype,
-        'hwsrc': pkt[scapy.ARP].hwsrc,
-        'hwdst': pkt[scapy.ARP].hwdst,
-        'op': "whois" if pkt[scapy.ARP].op == 1 else "reply",
-      }
-      for pkt in self.pcap
-      if pkt.haslayer(scapy.Ether) and pkt[scapy.Ether].type == 0x0806 # Is ARP
-    ])
+    self.optDf = self.scanned('opt')
     
     if save:
-      self.optDf.to_csv(fpath)
+      self.saveDf('opt')
+    return self
 
-  def getFooDf(self, save = True, load = True):
-    fpath = utils.dfPath(self.fbase, 'foo')
-    if load and os.path.isfile(fpath):
-      self.fooDf = pd.read_csv(fpath, index_col = 0)
-      return
+  def getFooDf(self, save = True, load = True, *, perSymbol = None, columns = None):
+    # A perSymbol other than the params' one isn't the foo the stage key stands for, it's computed but never saved
+    perSymbol = self.params['foo']['perSymbol'] if perSymbol is None else perSymbol
+    if self.loadDf('foo', load, columns):
+      return self
 
-    df = self.pcapDf.apply(
-      lambda row: pd.Series({
-        symbol: int(symbol == row['symbol'])
-        for symbol in self.symbolsDf['symbol']
-      }),
-      axis = 'columns'
-    )
-    for symbol in self.symbolsDf['symbol']:
-      df[f'{symbol}_count'] = df[symbol].cumsum()
-      df[f'{symbol}_p'] = df[f'{symbol}_count'] / (df.index + 1)
-      np.seterr(divide = 'ignore') # SEE: https://stackoverflow.com/a/53357052
-      df[f'{symbol}_I'] = -np.log2(df[f'{symbol}_p'])
-      np.seterr(divide = 'warn')
-      df[f'{symbol}_H'] = df[f'{symbol}_p'] * df[f'{symbol}_I']
-    df.replace([np.inf, -np.inf], 0, inplace = True)
-    df['H'] = df[[f'{symbol}_H' for symbol in self.symbolsDf['symbol']]].sum(axis = 'columns')
+    symbols = list(self.symbolsDf['symbol'])
+    codes = symtab.indexOf(self.codes(self.pcapDf), self.symbolsDf['code'])
+    df = self.cumulativeDf(codes, symbols, perSymbol = perSymbol)
+    df.index = self.pcapDf.index
 
     self.fooDf = df
+    if save and perSymbol == self.params['foo']['perSymbol']:
+      self.saveDf('foo')
+    return self
+
+  def getWindowDf(self, save = True, load = True):
+    if self.loadDf('window', load):
+      return self
+
+    symbols = list(self.symbolsDf['symbol'])
+    codes = symtab.indexOf(self.codes(self.pcapDf), self.symbolsDf['code'])
+    self.windowDf = entropy.windowedDf(codes, self.pcapDf['dt'], symbols, **self.params['window'])
+
     if save:
-      self.fooDf.to_csv(fpath)
+      self.saveDf('window')
+    return self
+
+  def cumulativeDf(self, codes, symbols, state = None, tracker = None, *, perSymbol = None):
+    # foo for a run of frames plus the Miller–Madow H and its bounds, state and tracker carry the frames before them
+    tracker = tracker if tracker is not None else convergence.Tracker(**self.params['foo']['convergence'])
+    perSymbol = self.params['foo']['perSymbol'] if perSymbol is None else perSymbol
+    df = entropy.cumulativeDf(codes, symbols, perSymbol = perSymbol, state = state)
+    bounds = tracker.update(codes)
+    for column in ['H_mm', 'lo', 'hi']:
+      df[column] = bounds[column].to_numpy()
+    return df
+
+  def convergedAt(self, fooDf = None):
+    # Frames until H converged, None if the capture is too short for it
+    return convergence.convergedAt(self.fooDf if fooDf is None else fooDf, **self.params['foo']['convergence'])
+
+  def codes(self, df):
+    # pcapDf keeps every field of each frame, the symbol is the part the symbol definition uses
+    return symtab.project(df['code'], self.params['symbols']['fields'])
+
+  def scanned(self, stage):
+    # What the stage's extractor got from the capture, process() gets every stale stage in the same pass
+    if stage not in self.scans:
+      self.requirePcap([stage])
+      self.scans.update(extract.scan(utils.pcapPath(self.fbase), [stage], **self.scope))
+    return self.scans.pop(stage)
+
+  #************************************************************
+  #* Cache ****************************************************
+
+  def stageKey(self, stage):
+    if stage == 'file':
+      return self.pcapFingerprint()['sha256']
+    info = Experiment.STAGES[stage]
+    inputs = [self.stageKey(_input) for _input in info['inputs']]
+    return cache.key(stage, info['version'], self.params.get(stage, {}), inputs)
+
+  def pcapFingerprint(self):
+    # None if the capture is gone and no stage recorded it
+    if not hasattr(self, 'fingerprint'):
+      meta = cache.loadMeta(self.fbase, 'pcap')
+      if not utils.pcapExists(self.fbase): # The one the cached stages were computed from still keys them
+        self.fingerprint = meta.get('pcap')
+        return self.fingerprint
+      self.fingerprint = cache.fileFingerprint(utils.pcapPath(self.fbase), meta.get('pcap'))
+      if meta and meta['pcap'] != self.fingerprint: # Touched, remember the new mtime so it isn't hashed again
+        cache.saveMeta(self.fbase, 'pcap', { **meta, 'pcap': self.fingerprint })
+    return self.fingerprint
+
+  def isFresh(self, stage):
+    if not store.exists(self.fbase, stage):
+      return False
+    if self.pcapFingerprint() is None: # Cached before stages had keys (no code column yet), its version can't be told
+      return False
+    return cache.loadMeta(self.fbase, stage).get('key') == self.stageKey(stage)
+
+  def loadDf(self, stage, load, columns = None):
+    if not (load and self.isFresh(stage)):
+      return False
+    setattr(self, Experiment.STAGES[stage]['df'], store.load(self.fbase, stage, columns))
+    return True
+
+  def iterDf(self, stage, columns = None, size = 1 << 20):
+    # The stage's DataFrame in batches of rows, read from disk unless it's already in memory
+    attr = Experiment.STAGES[stage]['df']
+    if attr not in self.__dict__ and self.isFresh(stage):
+      yield from store.iterBatches(self.fbase, stage, columns, size)
+      return
+    df = getattr(self, attr)
+    yield df if columns is None else df[columns]
+
+  def saveDf(self, stage):
+    store.save(getattr(self, Experiment.STAGES[stage]['df']), self.fbase, stage)
+    self.saveMeta(stage)
+
+  def requirePcap(self, stages):
+    if not utils.pcapExists(self.fbase):
+      raise FileNotFoundError(f'[{self.fbase}] The cache of {", ".join(stages)} is missing or from an older version and there is no {utils.pcapPath(self.fbase)} to compute it again')
+
+  def saveMeta(self, stage):
+    if self.pcapFingerprint() is not None:
+      cache.saveMeta(self.fbase, stage, { 'key': self.stageKey(stage), 'pcap': self.pcapFingerprint() })
 
   #************************************************************
   #* Report ***************************************************
 
-  def report(self):
+  def report(self, *, load = True):
+    key = self.reportKey()
+    if load and key is not None and cache.loadMeta(self.fbase, 'report').get('key') == key and self.reportExists():
+      print(f'[{self.fbase}.report] fresh')
+      return self
     print(f'[{self.fbase}.report]')
 
     self.reportMsg = f'# Report for **{self.fbase}**'
 
-    self.reportOverall()
-    self.reportCounts()
-    self.reportHITime()
-    self.reportOpt()
-
+    for section in [self.reportOverall, self.reportCounts, self.reportHITime, self.reportWindow, self.reportOpt]:
+      with self.metrics.span(section.__name__):
+        section()
+    self.reportMetrics()
     print(self.reportMsg)
+
+    # Every section and figure is built, only writing them is left
+    with self.metrics.span('export', rows = len(render.renderer().queue)):
+      render.flush(lambda: self.writeReport(key))
+    self.metrics.flush()
+    return self
+
+  def writeReport(self, key):
     with open(utils.mdPath(self.fbase, 'report'), 'w') as fout:
       fout.write(self.reportMsg)
+    if key is not None:
+      cache.saveMeta(self.fbase, 'report', { 'key': key })
 
-    return self
+  def reportKey(self):
+    # Same stages and figure formats as the last report means the same report, None if there's no pcap to key the stages on
+    if self.pcapFingerprint() is None:
+      return None
+    stages = [self.stageKey(stage) for stage in Experiment.STAGES]
+    return cache.key('report', Experiment.REPORT_VERSION, render.renderer().formats, stages)
+
+  def reportExists(self):
+    figs = render.renderer().manifest(self.fbase)
+    return os.path.isfile(utils.mdPath(self.fbase, 'report')) and all(os.path.isfile(os.path.join(utils.experimentPath(self.fbase), fig)) for fig in figs)
+
+  def reportMetrics(self):
+    self.addReport('Metrics', ['\n' + self.metrics.summaryDf().to_string(index = False, float_format = '{:.3f}'.format)]) # The export isn't done yet, it's only in metrics.jsonl
 
   def reportOverall(self):
     H = (self.symbolsDf['p'] * self.symbolsDf['information']).sum()
@@ -177,7 +456,7 @@ class Experiment:
     self.addReport('Overall', [
         f'Tramas: {len(self.pcapDf)}',
         f'Entropy: {H} (max {H_max})',
-        '\n' + self.symbolsDf.sort_values("information", ascending = False).to_string(index = False)
+        '\n' + self.symbolsDf.drop(columns = 'code').sort_values("information", ascending = False).to_string(index = False)
     ])
 
     self.reportPct()
@@ -197,7 +476,7 @@ class Experiment:
     )
 
   def reportBroadcast(self):
-    counts = self.pcapDf['dire'].value_counts()
+    counts = pd.Series(symtab.directions(self.pcapDf['code']), name = 'dire').value_counts()
     df = pd.DataFrame(counts)
     df['type'] = df.index
     df['p'] = df['count'] / counts.sum()
@@ -209,10 +488,7 @@ class Experiment:
   def reportCounts(self):
     fig = go.Figure()
     for symbol in self.symbolsDf['symbol']:
-      fig.add_trace(go.Scatter(
-        y = self.fooDf[f'{symbol}_count'],
-        name = symbol,
-      ))
+      fig.add_trace(self.scatter(self.fooDf[f'{symbol}_count'], symbol))
     fig.update_layout(
       # title = f'Relación entre el tiempo resolver y el tiempo para calcular LU ({reps} reps)',
       xaxis_title = 'Cantidad de paquetes',
@@ -223,14 +499,8 @@ class Experiment:
   def reportHITime(self):
     fig = go.Figure()
     for symbol in self.symbolsDf['symbol']:
-      fig.add_trace(go.Scatter(
-        y = self.fooDf[f'{symbol}_I'],
-        name = symbol,
-      ))
-    fig.add_trace(go.Scatter(
-      y = self.fooDf['H'],
-      name = 'H',
-    ))
+      fig.add_trace(self.scatter(self.fooDf[f'{symbol}_I'], symbol))
+    fig.add_trace(self.scatter(self.fooDf['H'], 'H'))
     fig.update_layout(
       # title = f'Relación entre el tiempo resolver y el tiempo para calcular LU ({reps} reps)',
       xaxis_title = 'Cantidad de paquetes',
@@ -241,42 +511,59 @@ class Experiment:
     self.reportH()
 
   def reportH(self):
-    fig = go.Figure(go.Scatter(
-      y = self.fooDf['H'],
-      name = 'H',
-    ))
+    fig = go.Figure([self.scatter(self.fooDf[column], column) for column in ['H', 'H_mm', 'lo', 'hi']])
+    convergedAt = self.convergedAt()
     fig.update_layout(
       title = 'Entropía de la red {utils.cleanUser(self.user)} en el contexto "{utils.cleanName(self.name)}"',
       xaxis_title = 'Cantidad de paquetes',
       yaxis_title = 'Entropía',
 
-      xaxis_range = [0, utils.hmaxX(self.name)],
+      xaxis_range = [0, convergedAt] if convergedAt else None,
     )
     self.saveFig(fig, 'h')
 
+    tol = self.params['foo']['convergence'].get('tol', convergence.TOL)
+    lo, hi = convergence.bootstrap(self.symbolsDf['count'])
+    last = self.fooDf.iloc[-1] if len(self.fooDf) else None
+    self.addReport('Convergence', [
+      f'H converged within {tol} bits after {convergedAt} frames' if convergedAt else f'H did not converge within {tol} bits',
+      f'Miller–Madow H: {last["H_mm"]} ({last["lo"]}, {last["hi"]})' if last is not None else 'Miller–Madow H: -',
+      f'Bootstrap interval of H: ({lo}, {hi})',
+    ])
+
+  def reportWindow(self):
+    fig = go.Figure()
+    for window, df in self.windowDf.groupby('window', sort = False):
+      fig.add_trace(go.Scatter(
+        x = df['t'], y = df['H'],
+        name = window,
+      ))
+    fig.update_layout(
+      xaxis_title = 'Tiempo (s)',
+      yaxis_title = 'Entropía por ventana',
+      legend_title = 'Ventana',
+    )
+    self.saveFig(fig, 'window_h')
+
   def reportOpt(self):
-    if len(self.optDf) == 0:
+    stats = arp.ArpStats()
+    for df in self.iterDf('opt', ['psrc', 'pdst', 'hwsrc', 'op']):
+      stats.update(df)
+    if stats.n == 0:
       self.addReport('Optional', ['NO ARP DATA'])
       return
 
-    _counts = self.optDf['pdst'].value_counts() + self.optDf['psrc'].value_counts()
-    _counts.dropna(inplace = True)
-    _df = pd.DataFrame()
-    _df['count'] = _counts
-    _df['symbol'] = _counts.index
-    _df['p'] = _counts / _counts.sum()
-    _df['information'] = -np.log2(_df['p'])
-    _df.sort_values('information', ascending = True, inplace = True)
-
-    H = (_df['p'] * _df['information']).sum()
-    H_max = np.log2(len(_df))
-
+    _df = stats.hostsDf()
+    macs = stats.macsDf()
     self.addReport('Optional', [
-      f'Hosts:\n{_df[["information"]].head()}',
-      f'Entropy: {H} (max {H_max})',
-      f'Predicted router: {_df.iloc[0]["symbol"]}'
+      f'Hosts: {len(_df)}\n{_df[["symbol", "information"]].head().to_string(index = False)}',
+      f'Entropy: {stats.H} (max {np.log2(len(_df))})',
+      f'Predicted router: {stats.router()}',
+      f'IPs with more than one MAC: {", ".join(macs.loc[macs["macs"] > 1, "ip"]) or "none"}',
     ])
 
+    # With thousands of hosts only the most frequent ones fit in a bar plot, the entropy is over all of them
+    _df = _df.head(Experiment.TOP_SYMBOLS)
     self.plotBar(
       _df, 'symbol', 'p',
       name = f'opt_pct_F', title = f'', xaxis_title = 'Símbolo', yaxis_title = '% de los paquetes',
@@ -286,23 +573,8 @@ class Experiment:
       name = f'opt_info_F', title = f'', xaxis_title = 'Símbolo', yaxis_title = 'Información',
     )
 
-    self.optDf['symbol_src'] = '(' + self.optDf['psrc'] + ', ' + self.optDf['op'] + ')'
-    self.optDf['symbol_dst'] = '(' + self.optDf['pdst'] + ', ' + self.optDf['op'] + ')'
-
-    allCounts = {
-      'src': self.optDf['symbol_src'].value_counts(),
-      'dst': self.optDf['symbol_dst'].value_counts(),
-    }
-    for v, counts in allCounts.items():
-      df = pd.DataFrame([
-        {
-          'symbol': symbol, 
-          'count': counts[symbol]
-        }
-        for symbol in list(self.optDf[f'symbol_{v}'].unique())
-      ])
-      df['p'] = df['count'] / len(self.optDf)
-      df['information'] = -np.log2(df['p'])
+    for v in ['src', 'dst']:
+      df = stats.symbolsDf(v).nsmallest(Experiment.TOP_SYMBOLS, 'information')
       self.plotBar(
         df, 'symbol', 'p',
         name = f'opt_pct_{v}', title = '', xaxis_title = 'Símbolo', yaxis_title = '% de los paquetes',
@@ -325,27 +597,34 @@ class Experiment:
     )
     self.saveFig(fig, name)
 
+  def scatter(self, y, name):
+    x, y = decimate.decimate(y) # One point per packet is too much for busy captures
+    return go.Scatter(x = x, y = y, name = name)
+
   def saveFig(self, fig, name):
-    return utils.saveFig(fig, self.fbase, f'{self.fbase}_{name}')
+    return render.saveFig(fig, self.fbase, f'{self.fbase}_{name}')
 
   #************************************************************
   #* Utils ****************************************************
 
   def loadPcap(self):
     if not hasattr(self, 'pcap') or self.pcap is None:
-      print(f'[{self.fbase}.loadPcap]')
       fpath = utils.pcapPath(self.fbase)
-      self.pcap = scapy.rdpcap(fpath)
+      with self.metrics.span('loadPcap') as span:
+        self.pcap = utils.loadPcap(self.fbase, **self.scope) if self.scope else scapy.rdpcap(fpath)
+        span['rows'] = len(self.pcap)
     return self
 
   def savePcap(self):
     print(f'[{self.fbase}.savePcap]')
     fpath = utils.pcapPath(self.fbase)
     scapy.wrpcap(fpath, self.pcap)
+    self.__dict__.pop('fingerprint', None)
     return self
 
   def mkDir(self):
     os.makedirs(utils.experimentPath(self.fbase), exist_ok = True)
+    os.makedirs(utils.INDIR, exist_ok = True)
 
   def addReport(self, title, info):
     #TODO: Correctly format df
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+import pandas as pd
+import numpy as np
+
+import pcapio
+import symtab
+
+# name -> bytes of each frame it needs and a function from an Ethernet chunk to a DataFrame
+EXTRACTORS = {}
+
+def extractor(name, snap):
+  def register(fn):
+    EXTRACTORS[name] = { 'snap': snap, 'fn': fn }
+    return fn
+  return register
+
+def scan(fpath, names, **kwargs):
+  # One pass over the capture fills the output of every extractor in names
+  if not names:
+    return {}
+  frames = { name: [] for name in names }
+  for dfs in iterScan(fpath, names, **kwargs):
+    for name, df in dfs.items():
+      frames[name].append(df)
+  return { name: pd.concat(dfs, ignore_index = True) for name, dfs in frames.items() }
+
+def iterScan(fpath, names, *, frames = None, seconds = None, **kwargs):
+  # Same as scan() but yields what each chunk of the capture gives. With frames or seconds only that range is read, through the pcap's index
+  snap = max(EXTRACTORS[name]['snap'] for name in names)
+  if frames is None and seconds is None:
+    chunks = pcapio.iterChunks(fpath, snap = snap, **kwargs)
+  else:
+    index = pcapio.PcapIndex(fpath)
+    chunks = index.iterChunks(*index.range(frames, seconds), snap = snap, **kwargs)
+  for chunk in chunks:
+    chunk = pcapio.etherOnly(chunk)
+    yield { name: EXTRACTORS[name]['fn'](chunk) for name in names }
+
+#************************************************************
+#* Extractors ***********************************************
+
+@extractor('pcap', symtab.SNAP)
+def etherSymbols(chunk):
+  return pd.DataFrame({
+    'code': symtab.encode(chunk['head']), # Broadcast, type, VLAN, IP protocol and ports, the symbol definition picks which ones to use
+    'dt': chunk['time'],
+  })
+
+@extractor('opt', pcapio.ARP_LEN)
+def arpFields(chunk):
+  head = chunk['head'][pcapio.etherType(chunk['head']) == 0x0806] # Is ARP
+  arp = pcapio.arpFields(head)
+  return pd.DataFrame({
+    'ptype': arp['ptype'],
+    'psrc': arp['psrc'],
+    'pdst': arp['pdst'],
+    'hwtype': arp['hwtype'],
+    'hwsrc': arp['hwsrc'],
+    'hwdst': arp['hwdst'],
+    'op': np.where(arp['op'] == 1, 'whois', 'reply'),
+  })
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+from contextlib import contextmanager
+from datetime import datetime
+from time import perf_counter, process_time
+import json
+import resource
+
+import utils
+
+pd = utils.lazyImport('pandas')
+
+COLUMNS = ['stage', 'cache', 'rows', 'wall', 'cpu', 'rss']
+RESET_PEAK = False # Each span gets its own peak RSS, but the process' ru_maxrss (what bench.py reads) is reset with it
+
+class Recorder:
+  # Wall time, CPU time, peak RSS, rows and cache hit/miss of each span, appended to metrics.jsonl on flush
+  def __init__(self, fbase, *, resetPeak = None):
+    self.fbase = fbase
+    self.resetPeak = RESET_PEAK if resetPeak is None else resetPeak
+    self.run = datetime.now().isoformat(timespec = 'seconds')
+    self.records = []
+    self.saved = 0
+    self.stack = []
+
+  @contextmanager
+  def span(self, stage, *, cache = None, rows = None):
+    # The caller can fill in rows (or cache) on the record it gets
+    record = { 'run': self.run, 'fbase': self.fbase, 'stage': stage, 'cache': cache, 'rows': rows }
+    record['rss'] = _resetPeak() if self.resetPeak else _peakRss()
+    self.stack.append(record)
+    wall, cpu = perf_counter(), process_time()
+    try:
+      yield record
+    finally:
+      record['wall'] = perf_counter() - wall
+      record['cpu'] = process_time() - cpu
+      record['rss'] = max(record['rss'], _peakRss())
+      self.stack.pop()
+      for parent in self.stack: # Resetting the high water mark would hide this peak from the spans around it
+        parent['rss'] = max(parent['rss'], record['rss'])
+      self.records.append(record)
+      print(f'[{self.fbase}.{stage}] {record["wall"]:.3f}s cpu={record["cpu"]:.3f}s rss={record["rss"]:.0f}MB rows={record["rows"]} cache={record["cache"]}')
+
+  def flush(self):
+    with open(utils.metricsPath(self.fbase), 'a') as fout:
+      for record in self.records[self.saved:]:
+        fout.write(json.dumps(record) + '\n')
+    self.saved = len(self.records)
+
+  def summaryDf(self):
+    df = pd.DataFrame(self.records, columns = COLUMNS)
+    return df.astype({ 'rows': 'Int64' }).fillna({ 'cache': '' })
+
+#************************************************************
+#* RSS ******************************************************
+# The peak since the process started, Linux lets a process reset its own high water mark if RESET_PEAK
+
+def _resetPeak():
+  try:
+    with open('/proc/self/clear_refs', 'w') as fout:
+      fout.write('5')
+  except OSError:
+    pass
+  return _peakRss()
+
+def _peakRss():
+  # MB
+  try:
+    with open('/proc/self/status') as fin:
+      for line in fin:
+        if line.startswith('VmHWM:'):
+          return int(line.split()[1]) / 2**10
+  except OSError:
+    pass
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10
@@ -1,19 +1,20 @@
-import re
-import plotly.graph_objects as go
-import plotly.express as px
-from plotly.subplots import make_subplots
-import numpy as np
+from argparse import ArgumentParser
 
 from analyze import analyzeAll
+import aggregate
+import render
 import utils
 
+go = utils.lazyImport('plotly.graph_objects')
+
 def mergeI(name, exps):
   fig = go.Figure()
 
-  for exp in exps:
+  for exp in exps.itertuples():
+    symbolsDf = aggregate.symbols(exp.fbase)
     fig.add_trace(go.Bar(
-      x = exp.symbolsDf['symbol'],
-      y = exp.symbolsDf['information'],
+      x = symbolsDf['symbol'],
+      y = symbolsDf['information'],
       name = utils.cleanUser(exp.user),
     ))
 
@@ -24,18 +25,19 @@ def mergeI(name, exps):
     legend_title = 'Red',
   )
 
-  utils.saveFig(fig, '.', f'merge_{name}_info')
+  render.saveFig(fig, '.', f'merge_{name}_info')
 
 def mergeH(name, exps):
   fig = go.Figure()
 
-  maxX = np.Inf
-  for exp in exps:
+  maxX = 0
+  for exp in exps.itertuples():
+    curve = aggregate.curve(exp.fbase) # Already decimated
     fig.add_trace(go.Scatter(
-      y = exp.fooDf['H'],
+      x = curve['x'], y = curve['H'],
       name = utils.cleanUser(exp.user),
     ))
-    maxX = min(maxX, len(exp.fooDf))
+    maxX = max(maxX, exp.xmax) # Until the slowest capture converged
 
   fig.update_layout(
     title = f'Entropía en el contexto "{utils.cleanName(name)}"',
@@ -43,15 +45,31 @@ def mergeH(name, exps):
     yaxis_title = 'Entropía',
     legend_title = 'Red',
 
-    xaxis_range = [0, maxX],
+    xaxis_range = [0, maxX] if maxX else None,
   )
 
-  print('hmaxX', name, utils.hmaxX(name))
-  utils.saveFig(fig, '.', f'merge_{name}_h')
+  print(f'[mergeH] {name} xaxis_range=[0, {maxX}]')
+  render.saveFig(fig, '.', f'merge_{name}_h')
 
 if __name__ == '__main__':
-  exps = analyzeAll(True)
+  parser = ArgumentParser(
+    prog = 'merge',
+    description = '', #TODO
+  )
+  parser.add_argument('--analyze', action = 'store_true', help = 'Analyze every capture first, otherwise only what process() already stored in the aggregate is used')
+  parser.add_argument('-j', '--jobs', type = int, default = 1, help = 'Captures to analyze in parallel')
+  parser.add_argument('--formats', default = ','.join(render.FORMATS), help = 'Comma separated figure formats to write')
+  parser.add_argument('--render-jobs', type = int, default = render.JOBS, help = 'Processes exporting figures')
+  args = parser.parse_args()
+  renderArgs = { 'formats': args.formats.split(','), 'jobs': args.render_jobs }
+  render.configure(**renderArgs)
+
+  if args.analyze:
+    analyzeAll(True, args.jobs, renderArgs)
+  exps = aggregate.captures()
   for name in ['baseline', 'comun', 'boot', 'busy']:
-    _exps = list(filter(lambda exp: re.search(name, exp.name), exps))
+    _exps = exps[exps['name'].str.contains(name)]
+    print(f'[merge] {name}\n{_exps[["fbase", "frames", "H", "converged"]].to_string(index = False)}')
     mergeI(name, _exps)
     mergeH(name, _exps)
+  render.flush()
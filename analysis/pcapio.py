@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+import numpy as np
+
+import struct
+import json
+import os
+
+PCAP_MAGIC = { # magic -> (endian, timestamp resolution)
+  b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+  b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+  b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+  b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+LINKTYPE_ETHERNET = 1
+ETHER_LEN = 14
+BLOCK_SIZE = 1 << 23 # 8MB per read
+INDEX_VERSION = 1
+INDEX_DTYPE = np.dtype([('offset', '<i8'), ('time', '<f8'), ('caplen', '<u4'), ('wirelen', '<u4'), ('linktype', '<u2'), ('ethertype', '<u2')])
+
+#************************************************************
+#* Reader ***************************************************
+
+def iterChunks(fpath, *, snap = ETHER_LEN, blockSize = BLOCK_SIZE):
+  # Yields one dict of NumPy arrays per block read, only the first `snap` bytes of each frame are kept (zero padded)
+  empty = True
+  with open(fpath, 'rb') as fin:
+    for buf, _, chunk in _blocks(fin, blockSize):
+      chunk['head'] = _heads(buf, chunk.pop('offset'), chunk['caplen'], snap)
+      empty = False
+      yield chunk
+  if empty: # A capture without frames is one empty chunk, like an empty range of PcapIndex
+    yield {
+      'time': np.empty(0), 'caplen': np.empty(0, dtype = np.uint32), 'wirelen': np.empty(0, dtype = np.uint32),
+      'linktype': np.empty(0, dtype = np.uint16), 'head': np.zeros((0, snap), dtype = np.uint8),
+    }
+
+def iterFrames(fpath, *, blockSize = BLOCK_SIZE):
+  # Whole frames as (time, bytes, wirelen), for when the first bytes aren't enough
+  with open(fpath, 'rb') as fin:
+    for buf, _, chunk in _blocks(fin, blockSize):
+      for time, offset, caplen, wirelen in zip(chunk['time'], chunk['offset'], chunk['caplen'], chunk['wirelen']):
+        yield float(time), buf[offset:offset + caplen], int(wirelen)
+
+def _blocks(fin, blockSize):
+  # (buf, where buf starts in the file, chunk) per block read, chunk offsets are into buf
+  magic = fin.read(4)
+  fin.seek(0)
+  if magic == PCAPNG_MAGIC:
+    return _pcapngBlocks(fin, blockSize)
+  if magic in PCAP_MAGIC:
+    return _pcapBlocks(fin, blockSize)
+  raise ValueError(f'[pcapio] {fin.name} is not a pcap/pcapng file')
+
+def _pcapBlocks(fin, blockSize):
+  header = fin.read(24)
+  endian, resol = PCAP_MAGIC[header[:4]]
+  linktype, = struct.unpack(endian + 'I', header[20:24])
+  linktype &= 0x0FFFFFFF # The upper bits carry the FCS length
+  caplenAt = struct.Struct(endian + 'I')
+
+  rest = b''
+  while True:
+    base = fin.tell() - len(rest)
+    data = fin.read(blockSize)
+    buf = rest + data
+
+    offsets, pos = [], 0
+    while pos + 16 <= len(buf): # Only walk the record headers, everything else is parsed with NumPy
+      caplen, = caplenAt.unpack_from(buf, pos + 8)
+      if pos + 16 + caplen > len(buf):
+        break
+      offsets.append(pos)
+      pos += 16 + caplen
+    rest = buf[pos:]
+
+    if offsets:
+      offsets = np.array(offsets, dtype = np.int64)
+      hdr = np.frombuffer(buf, np.uint8)[offsets[:, None] + np.arange(16)].view(endian + 'u4')
+      yield buf, base, {
+        'time': hdr[:, 0] + hdr[:, 1] * resol,
+        'caplen': hdr[:, 2].astype(np.uint32),
+        'wirelen': hdr[:, 3].astype(np.uint32),
+        'linktype': np.full(len(offsets), linktype, dtype = np.uint16),
+        'offset': offsets + 16,
+      }
+    if not data: # Whatever is left is a truncated record
+      break
+
+def _pcapngBlocks(fin, blockSize):
+  endian, ifaces = '<', []
+
+  rest = b''
+  while True:
+    base = fin.tell() - len(rest)
+    data = fin.read(blockSize)
+    buf = rest + data
+
+    offsets, caplens, wirelens, stamps, ifaceIds = [], [], [], [], []
+    pos = 0
+    while pos + 12 <= len(buf):
+      btype = buf[pos:pos + 4]
+      if btype == PCAPNG_MAGIC: # Section header, it sets the byte order for everything that follows
+        endian = '<' if buf[pos + 8:pos + 12] == b'\x4d\x3c\x2b\x1a' else '>'
+        ifaces = []
+      blen, = struct.unpack_from(endian + 'I', buf, pos + 4)
+      if blen < 12 or blen % 4: # It would never move past this block
+        raise ValueError(f'[pcapio] {fin.name}: bad pcapng block length {blen} at byte {base + pos}')
+      if pos + blen > len(buf):
+        break
+
+      btype, = struct.unpack_from(endian + 'I', buf, pos)
+      if btype == 1: # Interface description
+        ifaces.append(_pcapngIface(buf, pos, blen, endian))
+      elif btype == 6: # Enhanced packet
+        iface, hi, lo, caplen, wirelen = struct.unpack_from(endian + 'IIIII', buf, pos + 8)
+        offsets.append(pos + 28); caplens.append(caplen); wirelens.append(wirelen)
+        stamps.append((hi << 32) | lo); ifaceIds.append(iface)
+      elif btype == 3: # Simple packet, has no timestamp
+        wirelen, = struct.unpack_from(endian + 'I', buf, pos + 8)
+        offsets.append(pos + 12); caplens.append(min(wirelen, blen - 16)); wirelens.append(wirelen)
+        stamps.append(-1); ifaceIds.append(0)
+      pos += blen
+    rest = buf[pos:]
+
+    if offsets:
+      ifaceIds = np.array(ifaceIds, dtype = np.int64)
+      linktypes = np.array([linktype for linktype, _ in ifaces], dtype = np.uint16)
+      resols = np.array([resol for _, resol in ifaces], dtype = np.float64)
+      stamps = np.array(stamps, dtype = np.int64)
+      yield buf, base, {
+        'time': np.where(stamps >= 0, stamps * resols[ifaceIds], np.nan),
+        'caplen': np.array(caplens, dtype = np.uint32),
+        'wirelen': np.array(wirelens, dtype = np.uint32),
+        'linktype': linktypes[ifaceIds],
+        'offset': np.array(offsets, dtype = np.int64),
+      }
+    if not data:
+      break
+
+def _pcapngIface(buf, pos, blen, endian):
+  linktype, = struct.unpack_from(endian + 'H', buf, pos + 8)
+  resol = 1e-6
+
+  opt, end = pos + 16, pos + blen - 4
+  while opt + 4 <= end:
+    code, olen = struct.unpack_from(endian + 'HH', buf, opt)
+    if code == 0: # opt_endofopt
+      break
+    if code == 9: # if_tsresol
+      v = buf[opt + 4]
+      resol = 2.0 ** -(v & 0x7F) if v & 0x80 else 10.0 ** -v
+    opt += 4 + (olen + 3) // 4 * 4
+  return linktype, resol
+
+def _heads(buf, offsets, caplen, snap):
+  raw = buf if isinstance(buf, np.ndarray) else np.frombuffer(buf, np.uint8)
+  valid = np.arange(snap) < caplen[:, None]
+  idx = np.where(valid, offsets[:, None] + np.arange(snap), 0)
+  return np.where(valid, raw[idx], 0).astype(np.uint8)
+
+#************************************************************
+#* Index ****************************************************
+
+def indexPaths(fpath):
+  # Sidecar files next to the pcap
+  return f'{fpath}.idx.npy', f'{fpath}.idx.json'
+
+class PcapIndex:
+  # Where every frame of a pcap starts, its time, lengths and ethertype, built once into a memory mapped .idx.npy.
+  # Frames are sliced out of the memory mapped pcap, so a prefix or time range never reads the rest of the file
+  def __init__(self, fpath, *, blockSize = BLOCK_SIZE):
+    self.fpath = fpath
+    npyPath, metaPath = indexPaths(fpath)
+    self.meta = {}
+    if os.path.isfile(metaPath):
+      with open(metaPath) as fin:
+        self.meta = json.load(fin)
+    if any(self.meta.get(k) != v for k, v in self.fingerprint().items()) or not os.path.isfile(npyPath):
+      self.build(blockSize)
+    self.records = np.load(npyPath, mmap_mode = 'r') if self.meta['frames'] else np.empty(0, dtype = INDEX_DTYPE) # Empty arrays can't be mapped
+    self.raw = np.memmap(fpath, dtype = np.uint8, mode = 'r')
+    self.runningTime = None
+
+  def fingerprint(self):
+    stat = os.stat(self.fpath)
+    return { 'version': INDEX_VERSION, 'size': stat.st_size, 'mtime': stat.st_mtime_ns }
+
+  def build(self, blockSize):
+    print(f'[PcapIndex] Indexing {self.fpath}')
+    parts = []
+    with open(self.fpath, 'rb') as fin:
+      for buf, base, chunk in _blocks(fin, blockSize):
+        part = np.empty(len(chunk['offset']), dtype = INDEX_DTYPE)
+        part['offset'] = base + chunk['offset']
+        part['ethertype'] = etherType(_heads(buf, chunk['offset'], chunk['caplen'], ETHER_LEN))
+        for k in ['time', 'caplen', 'wirelen', 'linktype']:
+          part[k] = chunk[k]
+        parts.append(part)
+    records = np.concatenate(parts) if parts else np.empty(0, dtype = INDEX_DTYPE)
+
+    npyPath, metaPath = indexPaths(self.fpath)
+    np.save(npyPath, records)
+    time = records['time']
+    self.meta = { **self.fingerprint(), 'frames': len(records), 'sorted': bool((time[1:] >= time[:-1]).all()) }
+    with open(metaPath, 'w') as fout:
+      json.dump(self.meta, fout, indent = 2)
+
+  def __len__(self):
+    return len(self.records)
+
+  def frame(self, i):
+    # Bytes of frame i as a view into the pcap, nothing is copied
+    offset, caplen = int(self.records['offset'][i]), int(self.records['caplen'][i])
+    return self.raw[offset:offset + caplen]
+
+  def seekTime(self, seconds):
+    # First frame at least `seconds` after the first one. Frames out of order count from the latest time seen before them
+    if self.runningTime is None:
+      self.runningTime = self.records['time'] if self.meta['sorted'] else np.fmax.accumulate(self.records['time'])
+    if not len(self):
+      return 0
+    return int(np.searchsorted(self.runningTime, self.runningTime[0] + seconds, side = 'left'))
+
+  def range(self, frames = None, seconds = None):
+    # (start, stop) of the frames to read. frames is (start, stop) like a slice, seconds is (start, stop) since the first frame, None is open
+    start, stop, _ = slice(*(frames or (None, None))).indices(len(self))
+    if seconds is not None:
+      first, last = seconds
+      start = max(start, self.seekTime(first) if first is not None else 0)
+      stop = min(stop, self.seekTime(last) if last is not None else len(self))
+    return start, max(start, stop)
+
+  def iterChunks(self, start = 0, stop = None, *, snap = ETHER_LEN, blockSize = BLOCK_SIZE):
+    # Same chunks as iterChunks() for frames [start, stop), about blockSize bytes of frames each
+    records = self.records[start:stop]
+    ends = np.cumsum(records['caplen'].astype(np.int64) + 16)
+    bounds = np.unique(np.r_[0, np.searchsorted(ends, np.arange(blockSize, ends[-1] if len(ends) else 0, blockSize)), len(records)])
+    bounds = bounds if len(bounds) > 1 else [0, 0] # An empty range is one empty chunk, so there's still something to build DataFrames from
+    for a, b in zip(bounds[:-1], bounds[1:]):
+      block = records[a:b]
+      yield {
+        'time': block['time'].copy(),
+        'caplen': block['caplen'].copy(),
+        'wirelen': block['wirelen'].copy(),
+        'linktype': block['linktype'].copy(),
+        'head': _heads(self.raw, block['offset'], block['caplen'], snap),
+      }
+
+  def iterFrames(self, start = 0, stop = None):
+    # (time, bytes, wirelen) like iterFrames(), the bytes are views into the pcap
+    for i in range(*slice(start, stop).indices(len(self))):
+      yield float(self.records['time'][i]), self.frame(i), int(self.records['wirelen'][i])
+
+  def packets(self, start = 0, stop = None):
+    # scapy packets of frames [start, stop), what rdpcap would give for them
+    from scapy.all import PacketList, Raw, conf
+    pkts = []
+    for i, (time, frame, wirelen) in enumerate(self.iterFrames(start, stop), start = start):
+      pkt = conf.l2types.get(int(self.records['linktype'][i]), Raw)(bytes(frame))
+      pkt.time, pkt.wirelen = time, wirelen
+      pkts.append(pkt)
+    return PacketList(pkts)
+
+#************************************************************
+#* Writer ***************************************************
+
+class PcapWriter:
+  def __init__(self, fpath, *, linktype = LINKTYPE_ETHERNET, snaplen = 0xFFFF):
+    self.fout = open(fpath, 'wb')
+    self.fout.write(struct.pack('<IHHiIII', 0xA1B2C3D4, 2, 4, 0, 0, snaplen, linktype))
+    self.count = 0
+
+  def write(self, frame, time, wirelen = None):
+    usec = int(round(time * 1e6))
+    self.fout.write(struct.pack('<IIII', usec // 1000000, usec % 1000000, len(frame), wirelen or len(frame)))
+    self.fout.write(frame)
+    self.count += 1
+
+  def writeMany(self, times, frames):
+    # frames is an n x caplen uint8 array, all the records go out in one write
+    usec = np.round(np.asarray(times) * 1e6).astype(np.int64)
+    records = np.empty(len(frames), dtype = [('sec', '<u4'), ('usec', '<u4'), ('caplen', '<u4'), ('wirelen', '<u4'), ('frame', 'u1', frames.shape[1])])
+    records['sec'], records['usec'] = usec // 1000000, usec % 1000000
+    records['caplen'] = records['wirelen'] = frames.shape[1]
+    records['frame'] = frames
+    self.fout.write(records.tobytes())
+    self.count += len(frames)
+
+  def close(self):
+    self.fout.close()
+
+  def __enter__(self):
+    return self
+  def __exit__(self, *args):
+    self.close()
+
+class ChunkRing:
+  # Spreads frames over pcaps of chunkPackets frames each, only the last ringSize chunks are kept (all if None)
+  def __init__(self, dirpath, *, chunkPackets = 10000, ringSize = None):
+    self.dirpath = dirpath
+    self.chunkPackets = chunkPackets
+    self.ringSize = ringSize
+    self.fpaths = []
+    self.writer = None
+    self.chunks = 0
+    os.makedirs(dirpath, exist_ok = True)
+
+  def write(self, frame, time, wirelen = None):
+    if self.writer is None or self.writer.count >= self.chunkPackets:
+      self.rotate()
+    self.writer.write(frame, time, wirelen)
+
+  def rotate(self):
+    if self.writer is not None:
+      self.writer.close()
+    fpath = os.path.join(self.dirpath, f'{self.chunks:06d}.pcap')
+    self.writer = PcapWriter(fpath)
+    self.fpaths.append(fpath)
+    self.chunks += 1
+    while self.ringSize is not None and len(self.fpaths) > self.ringSize:
+      os.remove(self.fpaths.pop(0))
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+
+def catPcaps(fpaths, fpath):
+  # Concatenates pcaps written by PcapWriter, keeps the first global header only
+  if not fpaths: # Nothing was captured, still a valid pcap without frames
+    PcapWriter(fpath).close()
+    return
+  with open(fpath, 'wb') as fout:
+    for i, src in enumerate(fpaths):
+      with open(src, 'rb') as fin:
+        header = fin.read(24)
+        if i == 0:
+          fout.write(header)
+        while block := fin.read(BLOCK_SIZE):
+          fout.write(block)
+
+#************************************************************
+#* Ethernet *************************************************
+
+def etherOnly(chunk):
+  # Same frames scapy dissects as Ether, type <= 1500 is an 802.3 length and becomes Dot3
+  mask = (chunk['linktype'] == LINKTYPE_ETHERNET) & (chunk['caplen'] >= ETHER_LEN) & (etherType(chunk['head']) > 1500)
+  return { k: v[mask] for k, v in chunk.items() }
+
+def etherType(head):
+  return (head[:, 12].astype(np.uint16) << 8) | head[:, 13]
+
+def isBroadcast(head):
+  return (head[:, :6] == 0xFF).all(axis = 1)
+
+BROADCAST = b'\xff' * 6
+
+def macStrs(b):
+  return _join(HEX[b], ':')
+
+def ipStrs(b):
+  return _join(DEC[b], '.')
+
+def _join(parts, sep):
+  out = parts[:, 0]
+  for i in range(1, parts.shape[1]):
+    out = out + sep + parts[:, i]
+  return out
+
+HEX = np.array([f'{i:02x}' for i in range(256)], dtype = object)
+DEC = np.array([str(i) for i in range(256)], dtype = object)
+
+#************************************************************
+#* ARP ******************************************************
+
+ARP_LEN = ETHER_LEN + 28 # Ethernet/IPv4 ARP
+
+def arpFields(head):
+  arp = head[:, ETHER_LEN:ARP_LEN]
+  u16 = lambda i: (arp[:, i].astype(np.uint16) << 8) | arp[:, i + 1]
+  return {
+    'hwtype': u16(0),
+    'ptype': u16(2),
+    'op': u16(6),
+    'hwsrc': macStrs(arp[:, 8:14]),
+    'psrc': ipStrs(arp[:, 14:18]),
+    'hwdst': macStrs(arp[:, 18:24]),
+    'pdst': ipStrs(arp[:, 24:28]),
+  }
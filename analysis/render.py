@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import hashlib
+import json
+import os
+
+import utils
+
+FORMATS = ['html', 'pdf']
+JOBS = 2
+
+#************************************************************
+#* Renderer *************************************************
+
+class Renderer:
+  # Figures are queued as they're built and exported together on flush, by a pool of workers that keep kaleido running. Outputs that are up to date are skipped
+  def __init__(self, *, formats = None, jobs = None):
+    self.formats = list(formats or FORMATS)
+    self.jobs = jobs or JOBS
+    self.pool = None
+    self.queue = []
+    self.manifests = {}
+
+  def submit(self, fig, fbase, name):
+    figJson = fig.to_json()
+    manifest = self.manifest(fbase)
+    todo = {}
+    for fmt in self.formats:
+      fpath = utils.figPath(fbase, name, fmt)
+      digest = hashlib.sha1(f'{fmt}\n{figJson}'.encode()).hexdigest()
+      if manifest.get(os.path.basename(fpath)) != digest or not os.path.isfile(fpath):
+        todo[fpath] = digest
+    for fpath, digest in todo.items():
+      self.queue.append((figJson, fbase, fpath, digest))
+    if todo: # Nothing to export doesn't need workers (or a browser)
+      self.start()
+
+  def start(self):
+    # Workers come up (and start kaleido) while the rest of the report is built
+    if self.pool is not None:
+      return
+    if self.jobs == 1:
+      initWorker(self.formats); self.pool = 'inline'
+      return
+    self.pool = ProcessPoolExecutor(self.jobs, initializer = initWorker, initargs = (self.formats,))
+    for _ in range(self.jobs):
+      self.pool.submit(int)
+
+  def flush(self, *writes):
+    # Exports everything queued, writes (functions doing other file writes) run in threads meanwhile
+    asyncio.run(self.flushAsync(writes))
+
+  async def flushAsync(self, writes = ()):
+    queue, self.queue = self.queue, []
+    if queue:
+      self.start()
+
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(self.jobs) # Figures waiting for a worker stay here instead of piling up pickled in the pool
+    async def exportOne(figJson, fbase, fpath, digest):
+      async with slots:
+        if self.pool == 'inline':
+          export(figJson, [fpath])
+        else:
+          await loop.run_in_executor(self.pool, export, figJson, [fpath])
+      self.done(fbase, { fpath: digest })
+
+    await asyncio.gather(*[exportOne(*item) for item in queue], *[asyncio.to_thread(write) for write in writes])
+    for fbase, manifest in self.manifests.items():
+      with open(utils.rendersPath(fbase), 'w') as fout:
+        json.dump(manifest, fout, indent = 2, sort_keys = True)
+
+  def close(self):
+    # Idle workers keep the process that started them from exiting
+    if self.pool not in (None, 'inline'):
+      self.pool.shutdown()
+    self.pool = None
+
+  def done(self, fbase, todo):
+    self.manifest(fbase).update({ os.path.basename(fpath): digest for fpath, digest in todo.items() })
+
+  def manifest(self, fbase):
+    if fbase not in self.manifests:
+      fpath = utils.rendersPath(fbase)
+      self.manifests[fbase] = {}
+      if os.path.isfile(fpath):
+        with open(fpath) as fin:
+          self.manifests[fbase] = json.load(fin)
+    return self.manifests[fbase]
+
+#************************************************************
+#* Worker ***************************************************
+
+def initWorker(formats):
+  # MathJax's loading box ended up in the pdfs, it's why they used to be written twice
+  import plotly.io as pio
+  if hasattr(pio, 'defaults'): # plotly >= 6
+    pio.defaults.mathjax = None
+  if formats == ['html']:
+    return
+  try:
+    import kaleido
+  except ImportError:
+    return
+  if hasattr(kaleido, 'start_sync_server'): # kaleido >= 1, keep one browser for every write_image instead of one each
+    kaleido.start_sync_server(silence_warnings = True)
+  elif pio.kaleido.scope is not None: # kaleido 0.2 (the pinned one) keeps its own process, the first image starts it
+    import plotly.graph_objects as go
+    pio.kaleido.scope.mathjax = None
+    pio.to_image(go.Figure(), format = 'png', width = 10, height = 10)
+
+def export(figJson, fpaths):
+  import plotly.io as pio
+  fig = pio.from_json(figJson)
+  for fpath in fpaths:
+    if fpath.endswith('.html'):
+      fig.write_html(fpath)
+    else:
+      fig.write_image(fpath)
+
+#************************************************************
+#* Default renderer *****************************************
+
+_renderer = None
+
+def configure(**kwargs):
+  global _renderer
+  if _renderer is not None:
+    _renderer.flush()
+    _renderer.close()
+  _renderer = Renderer(**kwargs)
+
+def renderer():
+  if _renderer is None:
+    configure()
+  return _renderer
+
+def saveFig(fig, fbase, name):
+  renderer().submit(fig, fbase, name)
+
+def flush(*writes):
+  renderer().flush(*writes)
+
+def close():
+  if _renderer is not None:
+    _renderer.close()
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from urllib.parse import parse_qs, urlparse
+import http.client
+import json
+import os
+import socket
+import threading
+import traceback
+
+from analyze import listExperiments
+from experiment import Experiment
+import aggregate
+import utils
+
+np = utils.lazyImport('numpy')
+decimate = utils.lazyImport('decimate')
+
+MAX_EXPERIMENTS = 8
+MAX_MB = 1024 # Loaded DataFrames of every cached experiment together
+PORT = 8765
+
+class Service:
+  # Experiments stay loaded between queries, the least recently used ones are dropped past maxExperiments or maxMB
+  def __init__(self, *, maxExperiments = MAX_EXPERIMENTS, maxMB = MAX_MB):
+    self.maxExperiments, self.maxMB = maxExperiments, maxMB
+    self.experiments = OrderedDict() # fbase -> (Experiment, lock)
+    self.sizes = {} # fbase -> MB of its loaded DataFrames
+    self.lock = threading.Lock()
+    self.hits = self.misses = 0
+
+  def experiment(self, user, name):
+    fbase = utils.experimentName(user, name)
+    with self.lock:
+      if fbase in self.experiments:
+        self.hits += 1
+        self.experiments.move_to_end(fbase)
+        return self.experiments[fbase]
+      self.misses += 1
+      if not utils.pcapExists(fbase):
+        raise KeyError(f'No capture {fbase}')
+      entry = (Experiment(user, name), threading.Lock())
+      entry[1].acquire() # Queries for it wait until it's processed
+      self.experiments[fbase] = entry
+      self.sizes[fbase] = 0.0
+    try:
+      entry[0].process() # Only stale stages are computed, fresh ones load when a query uses them
+    except Exception:
+      with self.lock: # Half built, the next query tries again
+        if self.experiments.get(fbase) is entry:
+          del self.experiments[fbase], self.sizes[fbase]
+      raise
+    finally:
+      entry[1].release()
+    return entry
+
+  def query(self, user, name, fn):
+    # fn(experiment) under the experiment's lock, then the cache is trimmed to its new size
+    experiment, lock = self.experiment(user, name)
+    with lock:
+      out = fn(experiment)
+      size = sum(df.memory_usage(deep = True).sum() for df in _dfs(experiment)) / 2**20
+    with self.lock:
+      if experiment.fbase in self.experiments:
+        self.sizes[experiment.fbase] = size
+      self.trim()
+    return out
+
+  def trim(self):
+    # The most recent experiment stays even if it's over maxMB alone
+    while len(self.experiments) > 1 and (len(self.experiments) > self.maxExperiments or sum(self.sizes.values()) > self.maxMB):
+      fbase, _ = self.experiments.popitem(last = False)
+      del self.sizes[fbase]
+
+  #************************************************************
+  #* Queries **************************************************
+
+  def symbols(self, user, name):
+    def fn(experiment):
+      df = experiment.symbolsDf.drop(columns = 'code')
+      return { 'fbase': experiment.fbase, 'frames': int(df['count'].sum()), 'symbols': df.to_dict(orient = 'records') }
+    return self.query(user, name, fn)
+
+  def curve(self, user, name, start = 0, stop = None, points = None):
+    # H (and its Miller–Madow bounds) from frame start to stop, decimated to points if given
+    def fn(experiment):
+      if 'fooDf' not in experiment.__dict__:
+        experiment.getFooDf(columns = ['H', 'H_mm', 'lo', 'hi']) # Not the per symbol columns
+      df = experiment.fooDf.iloc[start:stop]
+      x, H = decimate.decimate(df['H'], points) if points else (np.arange(len(df)), df['H'].to_numpy())
+      out = { 'fbase': experiment.fbase, 'x': (x + (start or 0)).tolist(), 'H': H.tolist() }
+      for column in ['H_mm', 'lo', 'hi']:
+        out[column] = df[column].to_numpy()[x].tolist()
+      return out
+    return self.query(user, name, fn)
+
+  def compare(self, contexts = None):
+    # Captures of each context side by side, from the aggregate like merge.py
+    df = aggregate.captures()
+    out = {}
+    for context in contexts or sorted(df['name'].unique()):
+      rows = df[df['name'].str.contains(context, regex = False)].drop(columns = ['key', 'xmax'])
+      out[context] = [
+        { **row, 'symbols': aggregate.symbols(row['fbase']).to_dict(orient = 'records') }
+        for row in rows.astype(object).where(rows.notna(), None).to_dict(orient = 'records') # NULL converged is None, not NaN
+      ]
+    return out
+
+  def listing(self):
+    return [{ 'user': user, 'name': name, 'loaded': utils.experimentName(user, name) in self.experiments } for user, name in listExperiments()]
+
+  def stats(self):
+    with self.lock:
+      return { 'experiments': list(self.experiments), 'mb': self.sizes, 'hits': self.hits, 'misses': self.misses }
+
+def _dfs(experiment):
+  for info in Experiment.STAGES.values():
+    if info['df'] in experiment.__dict__:
+      yield experiment.__dict__[info['df']]
+
+#************************************************************
+#* HTTP *****************************************************
+# GET /experiments, /stats, /symbols?user=&name=, /curve?user=&name=&start=&stop=&points=, /compare?context=boot&context=busy
+
+class Handler(BaseHTTPRequestHandler):
+  service = None
+
+  def do_GET(self):
+    url = urlparse(self.path)
+    args = { k: v if k == 'context' else v[0] for k, v in parse_qs(url.query).items() }
+    try:
+      out = self.route(url.path, args)
+      self.reply(200, out)
+    except KeyError as e:
+      self.reply(404, { 'error': str(e) })
+    except (TypeError, ValueError) as e:
+      self.reply(400, { 'error': str(e) })
+    except Exception as e: # Anything else still gets an answer instead of a dropped connection
+      self.log_error('%s', traceback.format_exc())
+      self.reply(500, { 'error': f'{type(e).__name__}: {e}' })
+
+  def route(self, path, args):
+    intArg = lambda k: int(args[k]) if args.get(k) else None
+    if path in ('/symbols', '/curve') and not { 'user', 'name' } <= args.keys():
+      raise ValueError(f'{path} needs user and name')
+    if path == '/experiments':
+      return self.service.listing()
+    if path == '/stats':
+      return self.service.stats()
+    if path == '/symbols':
+      return self.service.symbols(args['user'], args['name'])
+    if path == '/curve':
+      return self.service.curve(args['user'], args['name'], intArg('start') or 0, intArg('stop'), intArg('points'))
+    if path == '/compare':
+      return self.service.compare(args.get('context'))
+    raise KeyError(f'No route {path}')
+
+  def reply(self, status, out):
+    body = json.dumps(out).encode()
+    self.send_response(status)
+    self.send_header('Content-Type', 'application/json')
+    self.send_header('Content-Length', str(len(body)))
+    self.end_headers()
+    self.wfile.write(body)
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+  daemon_threads = True
+
+  def server_bind(self):
+    if os.path.exists(self.server_address): # Left by a previous run
+      os.remove(self.server_address)
+    super().server_bind()
+
+  def get_request(self):
+    request, _ = super().get_request()
+    return request, ('unix', 0) # BaseHTTPRequestHandler logs client_address[0]
+
+def serve(service, *, port = PORT, path = None):
+  handler = type('ServiceHandler', (Handler,), { 'service': service })
+  server = UnixHTTPServer(path, handler) if path else ThreadingHTTPServer(('127.0.0.1', port), handler)
+  print(f'[service] Listening on {path or f"http://127.0.0.1:{port}"}')
+  return server
+
+def query(route, *, port = PORT, path = None):
+  # JSON a running service answers for route, e.g. '/symbols?user=JB&name=boot'
+  if path:
+    conn = http.client.HTTPConnection('localhost')
+    conn.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.sock.connect(path)
+  else:
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+  conn.request('GET', route)
+  response = conn.getresponse()
+  out = json.loads(response.read())
+  conn.close()
+  if response.status != 200:
+    raise RuntimeError(f'[service] {response.status} {out["error"]}')
+  return out
+
+if __name__ == '__main__':
+  parser = ArgumentParser(
+    prog = 'service',
+    description = 'Keeps experiments loaded and answers queries about them over local HTTP',
+  )
+  parser.add_argument('--port', type = int, default = PORT, help = 'Port on 127.0.0.1')
+  parser.add_argument('--socket', default = None, help = 'Listen on this Unix socket instead of a port')
+  parser.add_argument('--max-experiments', type = int, default = MAX_EXPERIMENTS, help = 'Experiments kept loaded')
+  parser.add_argument('--max-mb', type = float, default = MAX_MB, help = 'MB of DataFrames kept loaded')
+  args = parser.parse_args()
+
+  server = serve(Service(maxExperiments = args.max_experiments, maxMB = args.max_mb), port = args.port, path = args.socket)
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  server.server_close()
@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+from argparse import ArgumentParser
+import base64
+import hashlib
+import json
+import math
+import zlib
+
+import numpy as np
+
+import extract
+import symtab
+
+FIELDS = ['psrc', 'pdst', 'hwsrc'] # ARP fields that can have as many values as hosts in the broadcast domain
+WIDTH = 2048
+DEPTH = 4
+PRECISION = 12 # HyperLogLog with 2**12 registers, about 1.6% error
+VERSION = 2
+
+def _hashes(values, seed):
+  # 128 bit blake2b of each distinct value, as two 64 bit halves
+  digests = [hashlib.blake2b(str(value).encode(), digest_size = 16, salt = seed.to_bytes(16, 'little')).digest() for value in values]
+  return np.frombuffer(b''.join(digests), dtype = '<u8').reshape(-1, 2)
+
+def _pack(a):
+  return base64.b64encode(zlib.compress(a.tobytes())).decode() # Mostly zeros
+
+def _unpack(s, dtype, shape):
+  return np.frombuffer(zlib.decompress(base64.b64decode(s)), dtype = dtype).reshape(shape).copy()
+
+#************************************************************
+#* Sketches *************************************************
+
+class CountMin:
+  # Frequency of any value, never under the real one. Adding two tables counts both streams
+  def __init__(self, width = WIDTH, depth = DEPTH, seed = 0):
+    self.width, self.depth, self.seed = width, depth, seed
+    self.table = np.zeros((depth, width), dtype = np.int64)
+
+  def columns(self, values):
+    # Row i uses h1 + i * h2, two hashes are enough for every row
+    h = _hashes(values, self.seed)
+    return (h[:, :1] + np.arange(self.depth, dtype = np.uint64) * h[:, 1:]) % np.uint64(self.width)
+
+  def add(self, values, counts):
+    columns = self.columns(values)
+    for i in range(self.depth):
+      np.add.at(self.table[i], columns[:, i].astype(np.int64), counts)
+    return self
+
+  def estimate(self, value):
+    columns = self.columns([value])[0].astype(np.int64)
+    return int(self.table[np.arange(self.depth), columns].min())
+
+  def merge(self, other):
+    assert (self.width, self.depth, self.seed) == (other.width, other.depth, other.seed), 'Count-min sketches with different shapes'
+    out = CountMin(self.width, self.depth, self.seed)
+    out.table = self.table + other.table
+    return out
+
+  def toDict(self):
+    return { 'width': self.width, 'depth': self.depth, 'seed': self.seed, 'table': _pack(self.table) }
+
+  @classmethod
+  def fromDict(cls, d):
+    out = cls(d['width'], d['depth'], d['seed'])
+    out.table = _unpack(d['table'], np.int64, (d['depth'], d['width']))
+    return out
+
+class HyperLogLog:
+  # Distinct values seen, merging keeps the largest rank of each register
+  def __init__(self, precision = PRECISION, seed = 0):
+    self.precision, self.seed = precision, seed
+    self.registers = np.zeros(1 << precision, dtype = np.uint8)
+
+  def add(self, values):
+    bits = 64 - self.precision
+    for h in _hashes(values, self.seed)[:, 0].tolist():
+      i, rest = h >> bits, h & ((1 << bits) - 1)
+      self.registers[i] = max(self.registers[i], bits - rest.bit_length() + 1)
+    return self
+
+  def count(self):
+    m = len(self.registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(2.0 ** -self.registers.astype(np.float64))
+    zeros = int((self.registers == 0).sum())
+    if estimate <= 2.5 * m and zeros: # Linear counting while most registers are still empty
+      estimate = m * math.log(m / zeros)
+    return estimate
+
+  def merge(self, other):
+    assert (self.precision, self.seed) == (other.precision, other.seed), 'HyperLogLogs with different shapes'
+    out = HyperLogLog(self.precision, self.seed)
+    out.registers = np.maximum(self.registers, other.registers)
+    return out
+
+  def toDict(self):
+    return { 'precision': self.precision, 'seed': self.seed, 'registers': _pack(self.registers) }
+
+  @classmethod
+  def fromDict(cls, d):
+    out = cls(d['precision'], d['seed'])
+    out.registers = _unpack(d['registers'], np.uint8, -1)
+    return out
+
+#************************************************************
+#* Summary **************************************************
+
+class Summary:
+  # Exact symbol counts and ARP sketches of one or more captures, merged summaries are the summary of all their frames
+  def __init__(self, fields = None):
+    self.fields = list(fields or symtab.DEFAULT) # Symbol definition of the codes
+    self.frames = 0
+    self.counts = {} # symbol code -> frames
+    self.arp = 0
+    self.countMins = { field: CountMin() for field in FIELDS }
+    self.hlls = { field: HyperLogLog() for field in FIELDS }
+    self.hosts = HyperLogLog() # IPs as sender or target
+
+  def update(self, codes = None, optDf = None):
+    # codes of pcapDf and rows of optDf, from one chunk or a whole capture
+    if codes is not None:
+      self.frames += len(codes)
+      for code, count in symtab.counts(symtab.project(codes, self.fields)).items():
+        self.counts[code] = self.counts.get(code, 0) + count
+    if optDf is not None and len(optDf):
+      self.arp += len(optDf)
+      for field in FIELDS:
+        values, counts = np.unique(optDf[field].astype(str), return_counts = True)
+        self.countMins[field].add(values, counts)
+        self.hlls[field].add(values)
+      self.hosts.add(np.unique(np.r_[optDf['psrc'].astype(str), optDf['pdst'].astype(str)]))
+    return self
+
+  def merge(self, other):
+    assert self.fields == other.fields, f'Summaries with different symbols, {self.fields} and {other.fields}'
+    out = Summary(self.fields)
+    out.frames, out.arp = self.frames + other.frames, self.arp + other.arp
+    out.counts = dict(self.counts)
+    for code, count in other.counts.items():
+      out.counts[code] = out.counts.get(code, 0) + count
+    out.countMins = { field: self.countMins[field].merge(other.countMins[field]) for field in FIELDS }
+    out.hlls = { field: self.hlls[field].merge(other.hlls[field]) for field in FIELDS }
+    out.hosts = self.hosts.merge(other.hosts)
+    return out
+
+  def symbolsDf(self):
+    return symtab.symbolsDf(dict(sorted(self.counts.items())), self.fields)
+
+  @property
+  def H(self):
+    df = self.symbolsDf()
+    return (df['p'] * df['information']).sum()
+
+  def cardinalities(self):
+    return { 'hosts': self.hosts.count(), **{ field: hll.count() for field, hll in self.hlls.items() } }
+
+  def toDict(self):
+    return {
+      'version': VERSION, 'fields': self.fields, 'frames': self.frames, 'arp': self.arp,
+      'counts': { str(code): count for code, count in sorted(self.counts.items()) },
+      'countMins': { field: cm.toDict() for field, cm in self.countMins.items() },
+      'hlls': { field: hll.toDict() for field, hll in self.hlls.items() },
+      'hosts': self.hosts.toDict(),
+    }
+
+  @classmethod
+  def fromDict(cls, d):
+    assert d['version'] == VERSION, f'Summary version {d["version"]}, expected {VERSION}'
+    out = cls(d['fields'])
+    out.frames, out.arp = d['frames'], d['arp']
+    out.counts = { int(code): count for code, count in d['counts'].items() }
+    out.countMins = { field: CountMin.fromDict(cm) for field, cm in d['countMins'].items() }
+    out.hlls = { field: HyperLogLog.fromDict(hll) for field, hll in d['hlls'].items() }
+    out.hosts = HyperLogLog.fromDict(d['hosts'])
+    return out
+
+  def __eq__(self, other):
+    return isinstance(other, Summary) and self.toDict() == other.toDict()
+
+def fromExperiment(experiment):
+  # From the cached symbols and opt stages, without reading the pcap again
+  summary = Summary(experiment.params['symbols']['fields'])
+  summary.frames = int(experiment.symbolsDf['count'].sum())
+  summary.counts = dict(zip(experiment.symbolsDf['code'].tolist(), experiment.symbolsDf['count'].tolist()))
+  for df in experiment.iterDf('opt', FIELDS):
+    summary.update(optDf = df)
+  return summary
+
+def fromPcap(fpath, fields = None):
+  summary = Summary(fields)
+  for dfs in extract.iterScan(fpath, ['pcap', 'opt']):
+    summary.update(dfs['pcap']['code'], dfs['opt'])
+  return summary
+
+def load(fpath):
+  with open(fpath) as fin:
+    return Summary.fromDict(json.load(fin))
+
+def save(summary, fpath):
+  with open(fpath, 'w') as fout:
+    json.dump(summary.toDict(), fout)
+
+if __name__ == '__main__':
+  parser = ArgumentParser(
+    prog = 'sketch',
+    description = 'Mergeable symbol counts and ARP sketches, to combine captures without moving the pcaps',
+  )
+  commands = parser.add_subparsers(dest = 'command', required = True)
+  build = commands.add_parser('build', help = 'Summary of one capture')
+  build.add_argument('experiment', nargs = '*', help = '{USER} {EXPERIMENT_NAME}, from its cached stages')
+  build.add_argument('--pcap', default = None, help = 'Read this pcap instead of an experiment')
+  build.add_argument('--symbols', default = None, help = 'Comma separated symbol fields, like analyze.py')
+  build.add_argument('-o', '--out', required = True)
+  merge = commands.add_parser('merge', help = 'Combine summaries')
+  merge.add_argument('summaries', nargs = '+')
+  merge.add_argument('-o', '--out', required = True)
+  show = commands.add_parser('show', help = 'Entropy, symbols and cardinalities of a summary')
+  show.add_argument('summary')
+  show.add_argument('--ip', action = 'append', default = [], help = 'Also estimate how many ARP frames this IP sent')
+  args = parser.parse_args()
+
+  if args.command == 'build':
+    symbols = args.symbols.split(',') if args.symbols else None
+    if args.pcap is not None:
+      summary = fromPcap(args.pcap, symbols)
+    else:
+      from experiment import Experiment
+      summary = fromExperiment(Experiment(*args.experiment, symbols = symbols))
+    save(summary, args.out)
+  elif args.command == 'merge':
+    summaries = [load(fpath) for fpath in args.summaries]
+    summary = summaries[0]
+    for other in summaries[1:]:
+      summary = summary.merge(other)
+    save(summary, args.out)
+  else:
+    summary = load(args.summary)
+    print(f'Tramas: {summary.frames} (ARP {summary.arp})')
+    print(f'Entropy: {summary.H}')
+    print(summary.symbolsDf().drop(columns = 'code').sort_values('information', ascending = False).to_string(index = False))
+    print('Distinct (estimated): ' + ', '.join(f'{field}={count:.0f}' for field, count in summary.cardinalities().items()))
+    for ip in args.ip:
+      print(f'{ip} sent <= {summary.countMins["psrc"].estimate(ip)} ARP frames')
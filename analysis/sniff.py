@@ -9,7 +9,20 @@ if __name__ == '__main__':
     description = '', #TODO
   )
   parser.add_argument('experiment', nargs = 2, help = '{USER} {EXPERIMENT_NAME}')
+  parser.add_argument('--backend', choices = ['scapy', 'raw'], default = 'scapy', help = 'raw reads an AF_PACKET socket and writes the frames without dissecting them')
+  parser.add_argument('--iface', default = None, help = 'Interface for the raw backend (all of them by default)')
+  parser.add_argument('--filter', default = None, help = 'BPF expression the kernel applies with the raw backend, e.g. "arp or ip"')
+  parser.add_argument('--live', action = 'store_true', help = 'Update the symbol counts and entropy as frames arrive instead of keeping them in memory')
+  parser.add_argument('--interval', type = float, default = 1, help = 'Seconds between live summaries')
+  parser.add_argument('--chunk', type = int, default = 10000, help = 'Frames per pcap chunk in live mode')
+  parser.add_argument('--ring', type = int, default = None, help = 'Only keep the last RING chunks in live mode')
+  parser.add_argument('--alerts', action = 'store_true', help = 'Run detect.py\'s detector in live mode and print its alerts as they happen')
+  parser.add_argument('--until-converged', action = 'store_true', help = 'Stop sniffing in live mode once the entropy converged')
   args = parser.parse_args()
 
   experiment = Experiment(*args.experiment)
-  experiment.sniff().process(load = False).report()
+  if args.backend == 'raw':
+    experiment.sniff(backend = 'raw', iface = args.iface, bpf = args.filter)
+  else:
+    experiment.sniff(live = args.live, interval = args.interval, chunkPackets = args.chunk, ringSize = args.ring, untilConverged = args.until_converged, alerts = args.alerts)
+  experiment.process(load = False).report()
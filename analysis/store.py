@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+import os
+
+import utils
+
+pd = utils.lazyImport('pandas')
+
+CATEGORIES = ['symbol', 'dire', 'proto']
+ROWS = 1 << 16 # Rows per batch when a stage is read back in batches, unrelated to how many bytes of pcap are read at once
+
+#************************************************************
+#* Backends *************************************************
+
+class ParquetBackend:
+  ext = 'parquet'
+
+  def save(self, df, fpath):
+    df.to_parquet(fpath, compression = 'zstd')
+
+  def load(self, fpath, columns = None):
+    return asCategories(pd.read_parquet(fpath, columns = columns))
+
+  def appender(self, fpath):
+    return ParquetAppender(fpath)
+
+  def iterBatches(self, fpath, columns, size):
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(fpath).iter_batches(size, columns = columns):
+      yield batch.to_pandas()
+
+class CsvBackend:
+  ext = 'csv.tar.gz' # Pandas infers a gzipped tar from the extension
+
+  def save(self, df, fpath):
+    df.to_csv(fpath)
+
+  def load(self, fpath, columns = None):
+    usecols = None if columns is None else lambda c: c in columns or c.startswith('Unnamed')
+    df = pd.read_csv(fpath, index_col = 0, usecols = usecols)
+    return asCategories(df)
+
+  def appender(self, fpath):
+    return CsvAppender(fpath)
+
+  def iterBatches(self, fpath, columns, size):
+    usecols = lambda c: c in columns
+    for df in pd.read_csv(fpath, usecols = usecols, chunksize = size):
+      yield df
+
+#************************************************************
+#* Appenders ************************************************
+# Write a DataFrame one chunk at a time, categoricals go as plain strings since each chunk has its own categories
+
+class ParquetAppender:
+  def __init__(self, fpath):
+    self.fpath = fpath
+    self.writer = None
+    self.empty = None
+
+  def append(self, df):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    if len(df) == 0: # Its types may not be the real ones, only written if nothing else is
+      self.empty = df
+      return
+    table = pa.Table.from_pandas(asStrings(df), preserve_index = True)
+    if self.writer is None:
+      self.writer = pq.ParquetWriter(self.fpath, table.schema, compression = 'zstd')
+    self.writer.write_table(table.cast(self.writer.schema))
+
+  def close(self):
+    if self.writer is not None:
+      self.writer.close()
+    elif self.empty is not None:
+      ParquetBackend().save(self.empty, self.fpath)
+
+class CsvAppender:
+  # Tars can't be appended to, the plain csv is built next to it and archived at the end
+  def __init__(self, fpath):
+    self.fpath = fpath
+    self.part = f'{fpath}.part.csv'
+    self.header = True
+
+  def append(self, df):
+    asStrings(df).to_csv(self.part, mode = 'w' if self.header else 'a', header = self.header)
+    self.header = False
+
+  def close(self):
+    import tarfile
+    with tarfile.open(self.fpath, 'w:gz') as tar:
+      tar.add(self.part, arcname = os.path.basename(self.fpath)[:-len('.tar.gz')])
+    os.remove(self.part)
+
+BACKENDS = {
+  'parquet': ParquetBackend(),
+  'csv': CsvBackend(),
+}
+FORMAT = 'parquet'
+
+#************************************************************
+#* Store ****************************************************
+
+def save(df, fbase, name, *, fmt = None):
+  backend = BACKENDS[fmt or FORMAT]
+  backend.save(asCategories(df), utils.dfPath(fbase, name, backend.ext))
+
+def load(fbase, name, columns = None, *, fmt = None):
+  fmt = fmt or FORMAT
+  backend = BACKENDS[fmt]
+  fpath = utils.dfPath(fbase, name, backend.ext)
+  if os.path.isfile(fpath):
+    return backend.load(fpath, columns)
+
+  # Convert caches written in another format (e.g. the old CSVs) the first time they're read
+  for oldFmt, oldBackend in BACKENDS.items():
+    oldPath = utils.dfPath(fbase, name, oldBackend.ext)
+    if oldFmt != fmt and os.path.isfile(oldPath):
+      print(f'[store.load] Converting {oldPath} to {fmt}')
+      df = oldBackend.load(oldPath)
+      save(df, fbase, name, fmt = fmt)
+      return df if columns is None else df[columns]
+
+  raise FileNotFoundError(fpath)
+
+class Appender:
+  def __init__(self, fbase, name, *, fmt = None):
+    backend = BACKENDS[fmt or FORMAT]
+    self.appender = backend.appender(utils.dfPath(fbase, name, backend.ext))
+
+  def append(self, df):
+    self.appender.append(df)
+
+  def __enter__(self):
+    return self
+  def __exit__(self, *args):
+    self.appender.close()
+
+def iterBatches(fbase, name, columns, size = ROWS, *, fmt = None):
+  backend = BACKENDS[fmt or FORMAT]
+  return backend.iterBatches(utils.dfPath(fbase, name, backend.ext), columns, size)
+
+def exists(fbase, name):
+  return any(
+    os.path.isfile(utils.dfPath(fbase, name, backend.ext))
+    for backend in BACKENDS.values()
+  )
+
+def asStrings(df):
+  return df.astype({ column: str for column in CATEGORIES if column in df.columns })
+
+def asCategories(df):
+  for column in CATEGORIES:
+    if column in df.columns and not isinstance(df[column].dtype, pd.CategoricalDtype):
+      df[column] = df[column].astype('category')
+  return df
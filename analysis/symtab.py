@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+import numpy as np
+
+import entropy
+import pcapio
+import utils
+
+# A frame's code packs every field a symbol can be made of, a symbol definition is the subset of fields it keeps (a mask).
+# Labels are only built for the few distinct codes
+SNAP = 96 # Two VLAN tags, the longest IPv4 header and both ports
+DTYPE = np.uint64
+
+FIELDS = { # name -> (shift, bits)
+  'ethertype': (0, 16), # Type field of the Ethernet header, 802.1Q frames are all VLAN
+  'dire': (16, 1), # Broadcast or not
+  'cast': (16, 2), # Broadcast, multicast or unicast
+  'inner': (18, 16), # Ethertype after the VLAN tags
+  'vlan': (34, 12), # VLAN id of the outer tag, 0 untagged
+  'ipproto': (46, 9), # IPv4 protocol or IPv6 next header plus one, 0 if it isn't IP
+  'ports': (55, 2), # Class of the lower port of TCP, UDP and SCTP
+}
+DEFAULT = ['dire', 'ethertype']
+BROADCAST_BIT = 1 << 16
+VLAN_TYPES = [0x8100, 0x88A8, 0x9100]
+PORT_CLASSES = ['-', 'well-known', 'registered', 'dynamic'] # none, < 1024, < 49152, the rest
+IP_PROTOS = { 0: 'HOPOPT', 1: 'ICMP', 2: 'IGMP', 6: 'TCP', 17: 'UDP', 41: 'IPv6', 47: 'GRE', 50: 'ESP', 58: 'ICMPv6', 89: 'OSPF', 112: 'VRRP', 132: 'SCTP' }
+
+#************************************************************
+#* Decoder **************************************************
+
+def encode(head):
+  # head is n x SNAP (zero padded), every field of each frame in one code
+  head = head[:, :SNAP] if head.shape[1] >= SNAP else np.pad(head, ((0, 0), (0, SNAP - head.shape[1])))
+  rows = np.arange(len(head))
+  byte = lambda off: head[rows, np.minimum(off, SNAP - 1)].astype(np.int64) # Offsets and fields stay int64, mixing with uint64 gives floats
+  u16 = lambda off: (byte(off) << 8) | byte(off + 1)
+
+  ethertype = pcapio.etherType(head).astype(np.int64)
+  broadcast = pcapio.isBroadcast(head)
+  multicast = ((head[:, 0] & 1) == 1) & ~broadcast
+
+  inner, vlan, off = ethertype.copy(), np.zeros(len(head), dtype = np.int64), np.full(len(head), pcapio.ETHER_LEN)
+  for depth in range(2):
+    tagged = np.isin(inner, VLAN_TYPES)
+    if depth == 0:
+      vlan = np.where(tagged, u16(off) & 0xFFF, 0)
+    inner = np.where(tagged, u16(off + 2), inner)
+    off = np.where(tagged, off + 4, off)
+
+  ipv4, ipv6 = inner == 0x0800, inner == 0x86DD
+  proto = np.where(ipv4, byte(off + 9), np.where(ipv6, byte(off + 6), 0))
+  fragment = ipv4 & ((u16(off + 6) & 0x1FFF) != 0) # Only the first fragment has the ports
+  l4 = off + np.where(ipv4, (byte(off) & 0x0F) * 4, 40)
+  hasPorts = (ipv4 | ipv6) & ~fragment & np.isin(proto, [6, 17, 132])
+  port = np.minimum(u16(l4), u16(l4 + 2))
+  ports = np.where(hasPorts, np.where(port < 1024, 1, np.where(port < 49152, 2, 3)), 0)
+
+  values = {
+    'ethertype': ethertype, 'cast': broadcast | (multicast << 1), 'inner': inner, 'vlan': vlan,
+    'ipproto': np.where(ipv4 | ipv6, proto + 1, 0), 'ports': ports,
+  }
+  code = np.zeros(len(head), dtype = DTYPE)
+  for name, v in values.items():
+    code |= v.astype(DTYPE) << DTYPE(FIELDS[name][0])
+  return code
+
+def frameCode(frame):
+  # Single frame version of encode, None if it isn't an Ethernet II frame
+  if len(frame) < pcapio.ETHER_LEN or int.from_bytes(frame[12:14], 'big') <= 1500:
+    return None
+  head = np.frombuffer(frame[:SNAP].ljust(SNAP, b'\0'), dtype = np.uint8)[None]
+  return int(encode(head)[0])
+
+#************************************************************
+#* Symbol definitions ***************************************
+
+def mask(fields):
+  m = 0
+  for field in fields:
+    shift, bits = FIELDS[field]
+    m |= ((1 << bits) - 1) << shift
+  return m
+
+def project(codes, fields = None):
+  # Codes with only the fields of the symbol definition, frames that agree on them get the same code
+  return np.asarray(codes, dtype = DTYPE) & DTYPE(mask(fields or DEFAULT))
+
+def field(code, name):
+  shift, bits = FIELDS[name]
+  return (code >> shift) & ((1 << bits) - 1)
+
+def fieldStr(code, name):
+  v = field(code, name)
+  if name == 'dire':
+    return 'BROADCAST' if v else 'UNICAST'
+  if name == 'cast':
+    return 'BROADCAST' if v & 1 else 'MULTICAST' if v & 2 else 'UNICAST'
+  if name in ('ethertype', 'inner'):
+    return utils.getTypeStr(v)
+  if name == 'vlan':
+    return f'vlan{v}' if v else 'untagged'
+  if name == 'ipproto':
+    return IP_PROTOS.get(v - 1, str(v - 1)) if v else '-'
+  return PORT_CLASSES[v]
+
+def label(code, fields = None):
+  return '(' + ', '.join(fieldStr(int(code), name) for name in fields or DEFAULT) + ')'
+
+def labels(codes, fields = None):
+  uniq, inv = np.unique(np.asarray(codes), return_inverse = True)
+  return np.array([label(code, fields) for code in uniq], dtype = object)[inv]
+
+def directions(codes):
+  return np.where(np.asarray(codes) & BROADCAST_BIT, 'BROADCAST', 'UNICAST')
+
+#************************************************************
+#* Counting *************************************************
+
+def counts(codes):
+  # {code: count} in order of first appearance
+  uniq, first, count = np.unique(np.asarray(codes), return_index = True, return_counts = True)
+  order = np.argsort(first)
+  return dict(zip(uniq[order].tolist(), count[order].tolist()))
+
+def indexOf(codes, table):
+  # Position of each code in table, what entropy.cumulativeDf takes
+  table = np.asarray(table, dtype = DTYPE)
+  sorter = np.argsort(table)
+  return sorter[np.searchsorted(table, np.asarray(codes, dtype = DTYPE), sorter = sorter)]
+
+def symbolsDf(counts, fields = None):
+  df = entropy.symbolsDf(counts).rename(columns = { 'symbol': 'code' })
+  df.insert(0, 'symbol', labels(df['code'], fields))
+  return df
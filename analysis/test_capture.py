@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+# pipenv run python -m pytest test_capture.py
+import os
+
+import pytest
+
+from experiment import Experiment
+import capture
+import pcapio
+import utils
+
+PCAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'JB_boot.pcap')
+ARP = [(0x28, 0, 0, 12), (0x15, 0, 1, 0x0806), (0x06, 0, 0, 0x40000), (0x06, 0, 0, 0)] # tcpdump -dd arp, no libpcap needed
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+  monkeypatch.setattr(utils, 'INDIR', str(tmp_path / 'data'))
+  monkeypatch.setattr(utils, 'OUTDIR', str(tmp_path / 'out'))
+  os.makedirs(utils.INDIR)
+  return tmp_path
+
+def test_replay(dirs):
+  experiment = Experiment('JB', 'replay').sniffRaw(sock = capture.ReplaySocket(PCAP), bpf = ARP)
+  frames = [frame for _, frame, _ in pcapio.iterFrames(PCAP)]
+  arps = [frame for frame in frames if frame[12:14] == b'\x08\x06']
+  assert experiment.captureStats == { 'written': len(arps), 'received': len(frames), 'dropped': 0 }
+  assert [frame for _, frame, _ in pcapio.iterFrames(utils.pcapPath(experiment.fbase))] == arps
+
+def test_replay_closes(dirs):
+  # The socket is closed even if reading fails
+  class Broken(capture.ReplaySocket):
+    closed = False
+    def recvmsg(self, bufsize, ancbufsize = 0):
+      raise OSError('broken')
+    def close(self):
+      self.closed = True
+  sock = Broken(PCAP)
+  with pytest.raises(OSError):
+    Experiment('JB', 'replay').sniffRaw(sock = sock)
+  assert sock.closed
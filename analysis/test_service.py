@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# pipenv run python -m pytest test_service.py
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from experiment import Experiment
+import service
+import utils
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+PCAP = os.path.join(HERE, 'data', 'JB_boot.pcap')
+NAMES = ['a', 'b', 'c']
+
+@pytest.fixture(scope = 'module')
+def dirs(tmp_path_factory):
+  # Three copies of the same capture, processed once and cached for every test
+  root = tmp_path_factory.mktemp('service')
+  os.makedirs(root / 'data')
+  for name in NAMES:
+    shutil.copy(PCAP, root / 'data' / f'JB_{name}.pcap')
+  indir, outdir = utils.INDIR, utils.OUTDIR
+  utils.INDIR, utils.OUTDIR = str(root / 'data'), str(root / 'out')
+  yield root
+  utils.INDIR, utils.OUTDIR = indir, outdir
+
+@pytest.fixture
+def running(dirs):
+  # Serves a Service over TCP (port 0 picks a free one) or a Unix socket, yields how to query it
+  servers = []
+  def start(svc, path = None):
+    server = service.serve(svc, port = 0, path = path)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    servers.append(server)
+    return { 'path': path } if path else { 'port': server.server_address[1] }
+  yield start
+  for server in servers:
+    server.shutdown()
+    server.server_close()
+
+#************************************************************
+#* Cache ****************************************************
+
+def test_lru_by_count(dirs):
+  svc = service.Service(maxExperiments = 2)
+  for name in NAMES:
+    svc.symbols('JB', name)
+  assert svc.stats()['experiments'] == ['JB_b', 'JB_c']
+  svc.symbols('JB', 'b') # b is now the most recent, c goes first
+  svc.symbols('JB', 'a')
+  assert svc.stats()['experiments'] == ['JB_b', 'JB_a']
+  assert (svc.hits, svc.misses) == (1, 4)
+
+def test_lru_by_mb(dirs):
+  svc = service.Service(maxMB = 1e-6)
+  svc.symbols('JB', 'a')
+  assert svc.stats()['experiments'] == ['JB_a'] # Over the limit alone, but the last one used stays
+  svc.symbols('JB', 'b')
+  stats = svc.stats()
+  assert stats['experiments'] == ['JB_b']
+  assert list(stats['mb']) == ['JB_b'] and stats['mb']['JB_b'] > 0
+
+  svc = service.Service()
+  for name in NAMES:
+    svc.curve('JB', name)
+  sizes = svc.stats()['mb']
+  svc.maxMB = sizes['JB_b'] + sizes['JB_c'] # Only a has to go
+  svc.trim()
+  assert svc.stats()['experiments'] == ['JB_b', 'JB_c']
+
+def test_locking(dirs):
+  # Queries of one experiment run one at a time and it's only built once
+  svc = service.Service()
+  active, most = [0], [0]
+  def fn(experiment):
+    active[0] += 1
+    most[0] = max(most[0], active[0])
+    time.sleep(0.05)
+    active[0] -= 1
+    return len(experiment.symbolsDf)
+  out = []
+  threads = [threading.Thread(target = lambda: out.append(svc.query('JB', 'a', fn))) for _ in range(4)]
+  for thread in threads:
+    thread.start()
+  for thread in threads:
+    thread.join()
+  assert len(set(out)) == 1 and len(out) == 4
+  assert most[0] == 1
+  assert (svc.hits, svc.misses) == (3, 1)
+
+def test_cold_start(dirs, tmp_path):
+  # Different experiments processed at the same time by a fresh interpreter, where every lazy module is imported by whichever thread gets there first
+  script = f'''
+import json
+import threading
+import utils
+utils.INDIR, utils.OUTDIR = {str(dirs / 'data')!r}, {str(tmp_path / 'out')!r}
+import service
+svc, barrier, out = service.Service(), threading.Barrier({len(NAMES)}), []
+def run(name):
+  barrier.wait()
+  try:
+    out.append(svc.symbols('JB', name)['frames'])
+  except Exception as e:
+    out.append(repr(e))
+threads = [threading.Thread(target = run, args = (name,)) for name in {NAMES!r}]
+for thread in threads:
+  thread.start()
+for thread in threads:
+  thread.join()
+print(json.dumps(out))
+'''
+  done = subprocess.run([sys.executable, '-c', script], cwd = HERE, capture_output = True, text = True, timeout = 600)
+  assert done.returncode == 0, done.stderr
+  out = json.loads(done.stdout.strip().splitlines()[-1])
+  assert len(out) == len(NAMES) and all(isinstance(frames, int) and frames > 0 for frames in out), out
+
+def test_failed_process(dirs, monkeypatch):
+  svc = service.Service()
+  def fail(self, **kwargs):
+    raise RuntimeError('broken')
+  with monkeypatch.context() as m:
+    m.setattr(Experiment, 'process', fail)
+    with pytest.raises(RuntimeError):
+      svc.symbols('JB', 'a')
+  assert svc.stats()['experiments'] == [] and svc.stats()['mb'] == {}
+  assert svc.symbols('JB', 'a')['frames'] > 0 # Tried again, not the half built one
+
+def test_curve(dirs):
+  svc = service.Service()
+  frames = svc.symbols('JB', 'a')['frames']
+  out = svc.curve('JB', 'a', 100, 1100, 50)
+  assert len(out['x']) == len(out['H']) == len(out['lo']) == 50
+  assert out['x'][0] == 100 and out['x'][-1] == 1099
+  assert len(svc.curve('JB', 'a')['H']) == frames
+
+#************************************************************
+#* HTTP *****************************************************
+
+def test_routes(dirs, running):
+  where = running(service.Service())
+  assert [e['name'] for e in service.query('/experiments', **where)] == NAMES
+  out = service.query('/symbols?user=JB&name=a', **where)
+  assert out['fbase'] == 'JB_a' and out['symbols']
+  assert service.query('/stats', **where)['experiments'] == ['JB_a']
+
+  for route, status in [
+    ('/nope', 404),
+    ('/symbols?user=JB&name=nope', 404),
+    ('/symbols?user=JB', 400),
+    ('/curve?user=JB&name=a&points=many', 400),
+  ]:
+    with pytest.raises(RuntimeError, match = f'^\\[service\\] {status} '):
+      service.query(route, **where)
+
+def test_server_error(dirs, running, monkeypatch):
+  # Errors that aren't the client's are a 500 with the error, not a dropped connection
+  where = running(service.Service())
+  def fail(self, **kwargs):
+    raise RuntimeError('broken')
+  monkeypatch.setattr(Experiment, 'process', fail)
+  with pytest.raises(RuntimeError, match = '^\\[service\\] 500 RuntimeError: broken'):
+    service.query('/symbols?user=JB&name=a', **where)
+
+def test_unix_socket(dirs, running, tmp_path):
+  path = str(tmp_path / 'service.sock')
+  open(path, 'w').close() # Left by a previous run
+  where = running(service.Service(), path)
+  assert service.query('/symbols?user=JB&name=b', **where)['fbase'] == 'JB_b'
+  with pytest.raises(RuntimeError, match = '404'):
+    service.query('/nope', **where)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# pipenv run python -m pytest test_sketch.py
+import os
+
+import pytest
+
+import pcapio
+import sketch
+
+PCAP = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'JB_boot.pcap')
+
+@pytest.fixture(scope = 'module')
+def shards(tmp_path_factory):
+  # data/JB_boot.pcap cut in three pcaps of consecutive frames
+  root = tmp_path_factory.mktemp('sketch')
+  frames = list(pcapio.iterFrames(PCAP))
+  cuts = [0, len(frames) // 3, 2 * len(frames) // 3, len(frames)]
+  fpaths = []
+  for i, (a, b) in enumerate(zip(cuts[:-1], cuts[1:])):
+    fpaths.append(str(root / f'shard{i}.pcap'))
+    with pcapio.PcapWriter(fpaths[-1]) as writer:
+      for time, frame, wirelen in frames[a:b]:
+        writer.write(frame, time, wirelen)
+  return fpaths
+
+@pytest.mark.parametrize('fields', [None, ['cast', 'vlan', 'ipproto']])
+def test_merge_shards(shards, fields):
+  whole = sketch.fromPcap(PCAP, fields)
+  parts = [sketch.fromPcap(fpath, fields) for fpath in shards]
+  merged = parts[0].merge(parts[1]).merge(parts[2])
+  assert merged == whole
+  assert merged == parts[2].merge(parts[0].merge(parts[1])) # Order doesn't matter
+  assert merged.H == pytest.approx(whole.H)
+  assert whole.frames == sum(part.frames for part in parts) and whole.arp > 0
+
+def test_json(shards, tmp_path):
+  summary = sketch.fromPcap(shards[0])
+  sketch.save(summary, tmp_path / 'summary.json')
+  loaded = sketch.load(tmp_path / 'summary.json')
+  assert loaded == summary
+  assert loaded.cardinalities() == summary.cardinalities()
+  assert loaded.merge(sketch.fromPcap(shards[1])) == summary.merge(sketch.fromPcap(shards[1]))
+
+def test_different_fields(shards):
+  with pytest.raises(AssertionError):
+    sketch.fromPcap(shards[0]).merge(sketch.fromPcap(shards[1], ['cast']))
@@ -1,59 +1,72 @@
 #!/usr/bin/env python3
-from scapy.all import rdpcap, wrpcap
-
-import pandas as pd
+import importlib
+import threading
+import sys
 import os
 
 OUTDIR = './out'
 INDIR = './data'
-os.makedirs(OUTDIR, exist_ok = True)
-os.makedirs(INDIR, exist_ok = True)
 
 def experimentName(user, experiment):
   return f'{user}_{experiment}'
 
 def experimentPath(fbase):
   return os.path.join(OUTDIR, fbase)
-def dfPath(fbase, name):
-  return os.path.join(experimentPath(fbase), f'{name}.csv.tar.gz')
+def dfPath(fbase, name, ext):
+  return os.path.join(experimentPath(fbase), f'{name}.{ext}')
 def pcapPath(fbase):
   return os.path.join(INDIR, f'{fbase}.pcap')
-def imgPath(fbase, name):
-  return os.path.join(experimentPath(fbase), f'{name}.pdf')
-def htmlPath(fbase, name):
-  return os.path.join(experimentPath(fbase), f'{name}.html')
+def figPath(fbase, name, fmt):
+  return os.path.join(experimentPath(fbase), f'{name}.{fmt}')
+def rendersPath(fbase):
+  return os.path.join(experimentPath(fbase), 'renders.json')
 def mdPath(fbase, name):
   return os.path.join(experimentPath(fbase), f'{name}.md')
+def livePath(fbase):
+  return os.path.join(experimentPath(fbase), 'live')
+def metaPath(fbase, name):
+  return os.path.join(experimentPath(fbase), f'{name}.meta.json')
+def metricsPath(fbase):
+  return os.path.join(experimentPath(fbase), 'metrics.jsonl')
+def aggregatePath():
+  return os.path.join(OUTDIR, 'aggregate.sqlite')
 
 
-def saveDf(df, fpath):
-  fpath = dfPath(fpath)
-
-  print(f'[saveDf] {fpath=}')
-  os.makedirs(OUTDIR, exist_ok = True)
-  df.to_csv(fpath)
-
-def loadPcap(fpath):
+def loadPcap(fpath, frames = None, seconds = None):
   fpath = pcapPath(fpath)
 
-  print(f'[loadPcap] {fpath=}')
-  return rdpcap(fpath)
+  print(f'[loadPcap] {fpath=} {frames=} {seconds=}')
+  if frames is None and seconds is None:
+    from scapy.all import rdpcap
+    return rdpcap(fpath)
+  import pcapio
+  index = pcapio.PcapIndex(fpath) # Only the frames in range are read
+  return index.packets(*index.range(frames, seconds))
+
+def pcapExists(fbase):
+  return os.path.isfile(pcapPath(fbase))
 
-def loadDf(fpath):
-  fpath = dfPath(fpath)
+def lazyImport(name):
+  # The module is only imported the first time one of its attributes is used, so cached runs and --help don't pay for scapy, pandas or plotly
+  if name in sys.modules:
+    return sys.modules[name]
+  return LazyModule(name)
 
-  print(f'[loadDf] {fpath=}')
-  return pd.read_csv(fpath, index_col = 0)
+class LazyModule:
+  # importlib's LazyLoader isn't thread safe before Python 3.12, a second thread could see the module half loaded.
+  # Here the first attribute access imports it under a lock and every other thread waits for the whole import
+  def __init__(self, name):
+    self.__dict__.update(_name = name, _module = None, _lock = threading.RLock()) # Underscored so they don't hide the module's own
 
-def saveFig(fig, fbase, name):
-  fig.write_html(htmlPath(fbase, name))
-  fig.write_image(imgPath(fbase, name))
-  fig.write_image(imgPath(fbase, name)) # Do it a second time, wasteful but a quick solution for plotly's pdf error
+  def __getattr__(self, attr):
+    if self._module is None:
+      with self._lock:
+        if self._module is None:
+          self.__dict__['_module'] = importlib.import_module(self._name)
+    return getattr(self._module, attr)
 
-def dfExists(fbase, name):
-  return os.path.isfile(dfPath(fbase, name))
-def pcapExists(fbase):
-  return os.path.isfile(pcapPath(fbase))
+  def __repr__(self):
+    return f'<lazy module {self._name!r}>'
 
 def cleanName(name):
   if name == 'busy_150K':
@@ -76,18 +89,6 @@ def cleanUser(user):
   }
   return d.get(user, f'Red {user}')
 
-def hmaxX(name):
-  if name == 'busy_150K':
-    name = 'busy'
-
-  d = {
-    'baseline': 4195,
-    'comun': 20378,
-    'boot': 3392,
-    'busy': 29120,
-  }
-  return d[name]
-
 #************************************************************
 #* Ethertypes ***********************************************
 # SEE: https://github.com/secdev/scapy/blob/master/scapy/libs/ethertypes.py
@@ -95,6 +96,9 @@ def hmaxX(name):
 def getTypeStr(t):
   return type2Str.get(t, str(t))
 
+def symbolStr(dire, t):
+  return f'({dire}, {getTypeStr(t)})'
+
 type2Str = {
   0x0004: '8023', # IEEE 802.3 packet
   0x0200: 'PUP', # Xerox PUP protocol - see 0A00